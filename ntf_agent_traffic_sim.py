@@ -6,9 +6,9 @@ from __future__ import annotations
 import argparse
 import json
 from dataclasses import asdict, dataclass
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-from ntf_standard import run_ntf
+from ntf_standard import CompressionResult, run_ntf, run_ntf_batch
 
 
 @dataclass
@@ -92,18 +92,20 @@ def build_payload(template: str, approx_tokens: int) -> str:
     return " ".join(payload[:approx_tokens])
 
 
-def simulate(scenario: Scenario) -> Dict[str, object]:
+def _sample_payload(scenario: Scenario) -> str:
+    return build_payload(
+        scenario.payload_template,
+        approx_tokens=min(4500, scenario.avg_tokens_per_message * 3),
+    )
+
+
+def _project(scenario: Scenario, compression: CompressionResult) -> Dict[str, object]:
     daily_tokens_raw = (
         scenario.agents
         * scenario.avg_messages_per_agent_day
         * scenario.avg_tokens_per_message
     )
 
-    sample_payload = build_payload(
-        scenario.payload_template,
-        approx_tokens=min(4500, scenario.avg_tokens_per_message * 3),
-    )
-    compression = run_ntf(sample_payload)
     compression_x = (
         round(compression.original_words / compression.compressed_tokens, 2)
         if compression.compressed_tokens
@@ -124,6 +126,16 @@ def simulate(scenario: Scenario) -> Dict[str, object]:
     }
 
 
+def simulate(scenario: Scenario) -> Dict[str, object]:
+    return _project(scenario, run_ntf(_sample_payload(scenario)))
+
+
+def simulate_many(scenarios: List[Scenario], workers: Optional[int] = None) -> List[Dict[str, object]]:
+    """Simulate several scenarios, compressing their sample payloads as one batch."""
+    compressions = run_ntf_batch([_sample_payload(s) for s in scenarios], workers=workers, chunksize=1)
+    return [_project(s, c) for s, c in zip(scenarios, compressions)]
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Simulate A2A traffic scenarios for NTF")
     parser.add_argument(
@@ -134,9 +146,10 @@ def main() -> None:
         help="Subset of scenario keys to simulate",
     )
     parser.add_argument("--json", action="store_true", help="Emit JSON")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for payload compression")
     args = parser.parse_args()
 
-    results: List[Dict[str, object]] = [simulate(SCENARIOS[key]) for key in args.scenarios]
+    results = simulate_many([SCENARIOS[key] for key in args.scenarios], workers=args.workers)
 
     if args.json:
         print(json.dumps(results, indent=2))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Content-addressed LRU result cache for NTF compression and pipeline runs.
+
+Keys combine a BLAKE2b digest of the input text with a namespace, and with a
+fingerprint of everything else that shapes the result (vocabulary, algorithm
+version, call options). A vocabulary edit therefore misses the cache instead
+of serving stale entries. Cached values are shared between callers and must
+be treated as read-only.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+_MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    disk_hits: int = 0
+    disk_writes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return round(self.hits / lookups, 4) if lookups else 0.0
+
+
+def content_key(namespace: str, text: str, fingerprint: str = "") -> str:
+    digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+    return f"{namespace}:{fingerprint}:{digest}"
+
+
+class ResultCache:
+    """Size-bounded in-memory LRU with an optional on-disk second tier.
+
+    ``max_entries`` bounds the memory tier. The least recently used entry is
+    evicted first. With ``disk_dir`` set, every stored value is also pickled to
+    that directory. A memory miss then falls back to disk before recomputing,
+    so warm entries survive restarts. The disk tier is not evicted.
+    """
+
+    def __init__(self, max_entries: int = 4096, disk_dir: Optional[Union[str, Path]] = None) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries = max_entries
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _disk_path(self, key: str) -> Path:
+        name = hashlib.blake2b(key.encode("utf-8"), digest_size=20).hexdigest()
+        return self.disk_dir / f"{name}.pickle"  # type: ignore[operator]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.stats.hits += 1
+            return entries[key]
+
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                value = pickle.loads(path.read_bytes())
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+            else:
+                self.stats.hits += 1
+                self.stats.disk_hits += 1
+                self._remember(key, value)
+                return value
+
+        self.stats.misses += 1
+        return default
+
+    def put(self, key: str, value: Any) -> None:
+        self._remember(key, value)
+        if self.disk_dir is not None:
+            self._write_disk(key, value)
+
+    def _remember(self, key: str, value: Any) -> None:
+        entries = self._entries
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _write_disk(self, key: str, value: Any) -> None:
+        path = self._disk_path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                pickle.dump(value, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self.stats.disk_writes += 1
+
+    def get_or_compute(
+        self,
+        namespace: str,
+        text: str,
+        compute: Callable[[], Any],
+        fingerprint: str = "",
+    ) -> Any:
+        key = content_key(namespace, text, fingerprint)
+        missing = _MISSING
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Drop the memory tier; disk entries and counters are kept."""
+        self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**asdict(self.stats), "hit_rate": self.stats.hit_rate, "entries": len(self._entries)}
+
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Learned codebooks: frequent filler phrases mined from a corpus.
+
+Keyword folding leaves every word outside the vocabulary untouched. A
+codebook maps the most frequent multi-word filler n-grams of a training
+corpus (for example the eval/datasets JSONL files) to short code tokens such
+as ``<#0>`` or ``<#1f>``. ``run_ntf(text, codebook=book)`` substitutes them in
+the same single pass that folds keywords. Codes are assigned in order of
+estimated savings, so the most useful entries get the shortest codes.
+
+Codebook files are JSON with a format version, the fingerprint of the
+vocabulary they were mined against, and the entries in code order. The
+codebook fingerprint covers the entries, so cached results never mix books.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from ntf_standard import (
+    CODEBOOK_PREFIX,
+    CompiledVocabulary,
+    KeywordAutomaton,
+    NGramDetector,
+    _fingerprint,
+    active_vocabulary,
+    normalize_text,
+    run_ntf,
+)
+
+CODEBOOK_FORMAT = 1
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _code(index: int) -> str:
+    digits = ""
+    while True:
+        index, rem = divmod(index, len(_DIGITS))
+        digits = _DIGITS[rem] + digits
+        if not index:
+            return f"{CODEBOOK_PREFIX}{digits}>"
+
+
+@dataclass(frozen=True)
+class Codebook:
+    """Immutable phrase codebook; entry ``i`` is emitted as ``code(i)``."""
+
+    entries: Tuple[str, ...]
+    name: str = "codebook"
+    vocabulary: str = ""
+    fingerprint: str = field(init=False, compare=False)
+    _automata: Dict[Tuple[str, bool, bool], KeywordAutomaton] = field(
+        init=False, default_factory=dict, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "entries", tuple(" ".join(normalize_text(e)) for e in self.entries))
+        if not all(" " in entry for entry in self.entries):
+            raise ValueError("codebook entries must span at least two tokens")
+        object.__setattr__(self, "fingerprint", _fingerprint(CODEBOOK_FORMAT, self.entries))
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return Codebook, (self.entries, self.name, self.vocabulary)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def code(self, index: int) -> str:
+        return _code(index)
+
+    def automaton(
+        self,
+        vocabulary: CompiledVocabulary,
+        phrases: bool = False,
+        inflections: bool = False,
+    ) -> KeywordAutomaton:
+        """Keyword (optionally phrase and inflection) trie of ``vocabulary`` plus the codebook entries.
+
+        An entry that is already a vocabulary phrase keeps folding to its
+        concept. Compiled once per vocabulary and cached on the codebook.
+        """
+        key = (vocabulary.fingerprint, phrases, inflections)
+        automaton = self._automata.get(key)
+        if automaton is None:
+            keywords = vocabulary._inflected_lookup if inflections else vocabulary.keyword_map
+            automaton = KeywordAutomaton(keywords, vocabulary.phrase_map if phrases else {})
+            for index, entry in enumerate(self.entries):
+                words = entry.split(" ")
+                if automaton.match(words, 0)[0] != len(words):
+                    automaton.add(entry, _code(index))
+            self._automata[key] = automaton
+        return automaton
+
+    def expand(self, tokens: Iterable[str]) -> List[str]:
+        """Replace code tokens by the words they stand for; other tokens pass through."""
+        out: List[str] = []
+        prefix = CODEBOOK_PREFIX
+        for token in tokens:
+            if token.startswith(prefix):
+                out.extend(self.entries[int(token[len(prefix) : -1], 36)].split(" "))
+            else:
+                out.append(token)
+        return out
+
+    def save(self, path: Union[str, Path]) -> None:
+        payload = {
+            "format": CODEBOOK_FORMAT,
+            "name": self.name,
+            "fingerprint": self.fingerprint,
+            "vocabulary": self.vocabulary,
+            "entries": list(self.entries),
+        }
+        Path(path).write_text(json.dumps(payload, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+def load_codebook(path: Union[str, Path]) -> Codebook:
+    payload = json.loads(Path(path).read_text(encoding="utf-8"))
+    if payload.get("format") != CODEBOOK_FORMAT:
+        raise ValueError(f"{path}: unsupported codebook format {payload.get('format')!r}")
+    book = Codebook(tuple(payload["entries"]), name=payload.get("name", "codebook"), vocabulary=payload.get("vocabulary", ""))
+    if payload.get("fingerprint") not in (None, book.fingerprint):
+        raise ValueError(f"{path}: codebook entries do not match the stored fingerprint")
+    return book
+
+
+def mine_codebook(
+    texts: Iterable[Union[str, List[str]]],
+    max_entries: int = 256,
+    min_freq: int = 3,
+    sizes: Sequence[int] = (2, 3, 4),
+    vocabulary: Optional[CompiledVocabulary] = None,
+    name: str = "codebook",
+    net_of_entries: bool = False,
+) -> Codebook:
+    """Mine the n-grams that save the most tokens into a ``Codebook``.
+
+    ``texts`` holds documents, as strings or as ``normalize_text`` token
+    lists. Each is fed to one ``NGramDetector`` with a boundary in between.
+    N-grams containing a vocabulary keyword, keyword inflection or phrase are
+    skipped, since folding already covers them. An n-gram seen ``count`` times is estimated to save
+    ``(n - 1) * count`` tokens; overlaps between entries are not discounted.
+    ``net_of_entries`` charges each entry the ``n + 1`` tokens it takes to
+    ship it and drops entries that do not pay for themselves, for codebooks
+    that travel with the document they were mined from.
+    """
+    vocabulary = vocabulary if vocabulary is not None else active_vocabulary()
+    if min(sizes) < 2:
+        raise ValueError("codebook n-grams must span at least two tokens")
+    detector = NGramDetector(min_freq=min_freq, sizes=tuple(sizes))
+    for text in texts:
+        detector.feed(text if isinstance(text, list) else normalize_text(text)).end_document()
+
+    keywords = vocabulary._inflected_lookup
+    savings: Counter = Counter()
+    for gram, count in detector.patterns().items():
+        words = gram.split(" ")
+        if any(word in keywords for word in words) or next(vocabulary.automaton.scan(words), None):
+            continue
+        saved = (len(words) - 1) * count - (len(words) + 1 if net_of_entries else 0)
+        if saved > 0:
+            savings[gram] = saved
+    ranked = [gram for gram, _ in savings.most_common(max_entries)]
+    return Codebook(tuple(ranked), name=name, vocabulary=vocabulary.fingerprint)
+
+
+def read_jsonl_texts(paths: Iterable[Union[str, Path]], key: str = "text") -> Iterator[str]:
+    """Yield the ``key`` field of every record in the given JSONL files."""
+    for path in paths:
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)[key]
+
+
+def codebook_report(texts: Sequence[str], book: Codebook) -> Dict[str, Any]:
+    """Token counts with and without ``book`` over ``texts``."""
+    words = plain = coded = absorbed = 0
+    for text in texts:
+        base = run_ntf(text, compact=True)
+        with_book = run_ntf(text, compact=True, codebook=book)
+        words += base.original_words
+        plain += base.compressed_tokens
+        coded += with_book.compressed_tokens
+        absorbed += with_book.codebook_words
+    return {
+        "entries": len(book),
+        "original_words": words,
+        "compressed_tokens": plain,
+        "codebook_tokens": coded,
+        "codebook_words": absorbed,
+        "compression_x": round(words / plain, 3) if plain else 0.0,
+        "codebook_compression_x": round(words / coded, 3) if coded else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mine an NTF phrase codebook from JSONL corpora")
+    parser.add_argument("--train", nargs="+", required=True, help="JSONL files with a 'text' field")
+    parser.add_argument("--output", type=str, help="Write the codebook JSON here")
+    parser.add_argument("--max-entries", type=int, default=256)
+    parser.add_argument("--min-freq", type=int, default=3)
+    parser.add_argument("--name", type=str, default="codebook")
+    args = parser.parse_args()
+
+    texts = list(read_jsonl_texts(args.train))
+    book = mine_codebook(texts, max_entries=args.max_entries, min_freq=args.min_freq, name=args.name)
+    if args.output:
+        book.save(args.output)
+    print(json.dumps(codebook_report(texts, book), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""Per-stage timing and byte counters for pipeline runs.
+
+``run_pipeline(text, instrument=Instrumentation(...))`` records one
+``StageSample`` per stage (detect, compress, decode, identity, the RDF
+sub-scorers, SCS, security, and cache.get/cache.put with a cache): wall and
+CPU milliseconds plus the UTF-8 bytes going in and out. Stages never nest,
+so a run's ``wall_ms`` is the sum of its stages. Samples are forwarded to
+sinks as they complete. With
+``attach=True`` the samples of a run are also returned under the result's
+``instrumentation`` key.
+
+Without an ``Instrumentation`` the pipeline uses ``NULL_INSTRUMENTATION``,
+whose stages are one shared no-op context manager: no clock reads, no size
+computation, no allocation.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Protocol, Union
+
+
+@dataclass
+class StageSample:
+    run: int
+    stage: str
+    wall_ms: float
+    cpu_ms: float
+    bytes_in: int
+    bytes_out: int
+
+
+class Sink(Protocol):
+    def emit(self, sample: StageSample) -> None: ...
+
+
+def payload_size(value: Any) -> int:
+    """UTF-8 size of the text carried by a pipeline value (str, segments, payload dicts)."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode("utf-8", "surrogatepass"))
+    if isinstance(value, dict):
+        if "segments" in value:
+            return payload_size(value["segments"])
+        return payload_size(value.get("payload", value.get("content")))
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    content = getattr(value, "content", None)
+    return payload_size(content) if isinstance(content, str) else 0
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+    def output(self, value: Any) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullInstrumentation:
+    """Disabled instrumentation: every stage is the same no-op context manager."""
+
+    enabled = False
+    attach = False
+
+    def stage(self, name: str, data_in: Any = None) -> _NullTimer:
+        return _NULL_TIMER
+
+    def begin_run(self) -> None:
+        pass
+
+    def report(self) -> Dict[str, Any]:
+        return {}
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+class _StageTimer:
+    __slots__ = ("_owner", "_name", "_data_in", "_data_out", "_wall", "_cpu")
+
+    def __init__(self, owner: "Instrumentation", name: str, data_in: Any) -> None:
+        self._owner = owner
+        self._name = name
+        self._data_in = data_in
+        self._data_out = None
+
+    def __enter__(self) -> "_StageTimer":
+        self._cpu = time.thread_time_ns()
+        self._wall = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        wall = time.perf_counter_ns() - self._wall
+        cpu = time.thread_time_ns() - self._cpu
+        # Sizes are measured after the clocks stop, so they are not timed.
+        self._owner._record(self._name, wall, cpu, payload_size(self._data_in), payload_size(self._data_out))
+
+    def output(self, value: Any) -> None:
+        """The stage's result, measured for ``bytes_out`` when the stage ends."""
+        self._data_out = value
+
+
+class Instrumentation:
+    """Collects ``StageSample``s for pipeline runs and forwards them to ``sinks``.
+
+    One instance can serve many consecutive runs; ``samples`` holds the
+    current run's. Use one instance per thread; sinks may be shared.
+    """
+
+    enabled = True
+
+    def __init__(self, *sinks: Sink, attach: bool = False) -> None:
+        self.sinks = list(sinks)
+        self.attach = attach
+        self.runs = 0
+        self.samples: List[StageSample] = []
+
+    def begin_run(self) -> None:
+        self.runs += 1
+        self.samples = []
+
+    def stage(self, name: str, data_in: Any = None) -> _StageTimer:
+        return _StageTimer(self, name, data_in)
+
+    def _record(self, name: str, wall_ns: int, cpu_ns: int, bytes_in: int, bytes_out: int) -> None:
+        sample = StageSample(self.runs, name, wall_ns / 1e6, cpu_ns / 1e6, bytes_in, bytes_out)
+        self.samples.append(sample)
+        for sink in self.sinks:
+            sink.emit(sample)
+
+    def report(self) -> Dict[str, Any]:
+        """The current run's samples, as attached to pipeline results."""
+        return {
+            "run": self.runs,
+            "wall_ms": round(sum(s.wall_ms for s in self.samples), 3),
+            "stages": [asdict(s) for s in self.samples],
+        }
+
+
+class HistogramSink:
+    """In-memory per-stage aggregates with power-of-two wall-time buckets (in microseconds)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, Any]] = {}
+
+    def emit(self, sample: StageSample) -> None:
+        micros = max(1, int(sample.wall_ms * 1000))
+        bucket = 1 << (micros - 1).bit_length()
+        with self._lock:
+            stats = self._stages.get(sample.stage)
+            if stats is None:
+                stats = self._stages[sample.stage] = {
+                    "count": 0,
+                    "wall_ms": 0.0,
+                    "cpu_ms": 0.0,
+                    "max_wall_ms": 0.0,
+                    "bytes_in": 0,
+                    "bytes_out": 0,
+                    "buckets": {},
+                }
+            stats["count"] += 1
+            stats["wall_ms"] += sample.wall_ms
+            stats["cpu_ms"] += sample.cpu_ms
+            stats["max_wall_ms"] = max(stats["max_wall_ms"], sample.wall_ms)
+            stats["bytes_in"] += sample.bytes_in
+            stats["bytes_out"] += sample.bytes_out
+            stats["buckets"][bucket] = stats["buckets"].get(bucket, 0) + 1
+
+    def quantile(self, stage: str, q: float) -> float:
+        """Upper bucket bound (ms) below which a fraction ``q`` of the stage's samples fall."""
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                return 0.0
+            target = q * stats["count"]
+            seen = 0
+            for bucket in sorted(stats["buckets"]):
+                seen += stats["buckets"][bucket]
+                if seen >= target:
+                    return bucket / 1000
+            return max(stats["buckets"]) / 1000
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            stages = {name: dict(stats, buckets=dict(stats["buckets"])) for name, stats in self._stages.items()}
+        out = {}
+        for name, stats in stages.items():
+            count = stats["count"]
+            out[name] = {
+                "count": count,
+                "mean_wall_ms": round(stats["wall_ms"] / count, 4),
+                "mean_cpu_ms": round(stats["cpu_ms"] / count, 4),
+                "p50_wall_ms": self.quantile(name, 0.5),
+                "p95_wall_ms": self.quantile(name, 0.95),
+                "max_wall_ms": round(stats["max_wall_ms"], 4),
+                "bytes_in": stats["bytes_in"],
+                "bytes_out": stats["bytes_out"],
+            }
+        return out
+
+
+class JsonlSink:
+    """Appends one JSON object per sample to ``path``."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def emit(self, sample: StageSample) -> None:
+        line = json.dumps(asdict(sample)) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(line)
+
+
+def read_samples(path: Union[str, Path]) -> Iterable[StageSample]:
+    """Samples written by ``JsonlSink``."""
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield StageSample(**json.loads(line))
+
+
+def as_instrumentation(instrument: Optional[Union[Instrumentation, NullInstrumentation]]) -> Any:
+    return NULL_INSTRUMENTATION if instrument is None else instrument
@@ -10,7 +10,7 @@ from pathlib import Path
 from statistics import mean
 from typing import Dict, List
 
-from ntf_multimodal_pipeline import run_pipeline
+from ntf_multimodal_pipeline import run_pipeline_batch
 
 
 def load_jsonl(path: Path) -> List[Dict[str, str]]:
@@ -27,8 +27,7 @@ def run_benchmark(path: Path) -> Dict[str, object]:
     rows = load_jsonl(path)
     results = []
 
-    for row in rows:
-        out = run_pipeline(row["text"])
+    for row, out in zip(rows, run_pipeline_batch([row["text"] for row in rows])):
         metrics = out["payload"]["metrics"]
         security = out["payload"]["security"]
         results.append(
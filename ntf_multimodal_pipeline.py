@@ -13,17 +13,38 @@ from __future__ import annotations
 import argparse
 import ast
 import difflib
+import hashlib
 import json
 import math
+import os
 import re
-from dataclasses import asdict, dataclass
+import threading
+from collections import Counter
+from dataclasses import asdict, astuple, dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Literal
-
-from ntf_standard import run_ntf
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Literal, Optional, Pattern, Sequence, Tuple, Union
+
+try:
+    import numpy as np  # optional: vectorized hashed-trigram similarity
+except ImportError:  # pragma: no cover - depends on environment
+    np = None
+
+from ntf_cache import ResultCache, content_key
+from ntf_instrument import NULL_INSTRUMENTATION, Instrumentation, JsonlSink, as_instrumentation
+from ntf_standard import (
+    CompiledVocabulary,
+    active_vocabulary,
+    decode_reversible,
+    encode_reversible,
+    run_ntf,
+    vocabulary_fingerprint,
+)
 
 SegmentType = Literal["text", "code", "json"]
 
+PIPELINE_SCHEMA = "ntf.multimodal"
+PIPELINE_VERSION = "0.3"
+
 INJECTION_MARKERS = {
     "ignore previous instructions": 18,
     "system prompt": 16,
@@ -47,6 +68,8 @@ SEMANTIC_GROUPS = {
     "delivery": {"deploy", "deployment", "release", "ship"},
 }
 
+IMPERATIVE_CUES = ("must", "now", "immediately", "ignore", "reveal", "bypass", "override")
+
 SENSITIVE_PATTERNS = {
     "api_key": (re.compile(r"\b(api[_-]?key|secret[_-]?key|token)\b", re.I), 10),
     "bearer": (re.compile(r"\bbearer\s+[a-z0-9\-._~+/]+=*", re.I), 14),
@@ -54,12 +77,62 @@ SENSITIVE_PATTERNS = {
     "iban": (re.compile(r"\b[A-Z]{2}\d{2}[A-Z0-9]{11,30}\b", re.I), 8),
 }
 
+# Literals every match of a sensitive pattern contains (case-insensitively).
+# Text without any of them skips that pattern's regex.
+SENSITIVE_PREFILTERS = {
+    "api_key": ("key", "token"),
+    "bearer": ("bearer",),
+    "email": ("@",),
+}
+
+
+_UNPARSED = object()
+_NOT_JSON = object()
+
+
+def _parse_json_block(block: str) -> Any:
+    """Parsed value of a ``{...}``/``[...]`` block, or ``_NOT_JSON``."""
+    stripped = block.strip()
+    if not (
+        (stripped.startswith("{") and stripped.endswith("}"))
+        or (stripped.startswith("[") and stripped.endswith("]"))
+    ):
+        return _NOT_JSON
+    try:
+        return json.loads(stripped)
+    except (ValueError, RecursionError):
+        return _NOT_JSON
+
 
 @dataclass
 class Segment:
+    """One detected block. JSON content is parsed and canonicalized at most once.
+
+    ``detect_segments`` hands over the value it parsed while classifying the
+    block, so compression, identity checks and scoring never re-parse it.
+    """
+
     kind: SegmentType
     content: str
     language: str = ""
+    _json: Any = field(default=_UNPARSED, init=False, repr=False, compare=False)
+    _canonical: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def json_value(self) -> Any:
+        """Parsed content; raises ValueError when the content is not JSON."""
+        if self._json is _UNPARSED:
+            self._json = _parse_json_block(self.content)
+        if self._json is _NOT_JSON:
+            raise ValueError(f"{self.kind} segment content is not JSON")
+        return self._json
+
+    @property
+    def canonical_json(self) -> str:
+        """Sorted-key serialization of ``json_value``, as stored in compressed payloads."""
+        if self._canonical is None:
+            self._canonical = json.dumps(self.json_value, ensure_ascii=False, sort_keys=True)
+        return self._canonical
 
 
 @dataclass
@@ -77,26 +150,48 @@ class PipelinePayload:
     segments: List[CompressedSegment]
     metrics: Dict[str, float]
     security: Dict[str, Any]
+    profile: str = "full"
+    metrics_computed: List[str] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class MetricProfile:
+    """Which scorers ``run_pipeline`` runs.
+
+    ``rdf`` is ``"full"`` to always score roundtrip fidelity, or
+    ``"identity"`` to report it only when the identity check makes it free.
+    ``embedding`` names the backends tried for semantic similarity, in order
+    (``None`` uses the registry's default order). ``scs`` enables the
+    structural score with its AST checks. The security scan always runs.
+    """
+
+    name: str
+    rdf: Literal["identity", "full"] = "full"
+    embedding: Optional[Tuple[str, ...]] = None
+    scs: bool = True
+
+
+METRIC_PROFILES: Dict[str, MetricProfile] = {
+    # Online proxy path: compression and SSR; RDF only when it costs nothing.
+    "fast": MetricProfile("fast", rdf="identity", scs=False),
+    # Every metric, with the vectorized or pure-Python trigram similarity.
+    "standard": MetricProfile("standard", embedding=("trigram-hashed", "trigram-fallback")),
+    # Offline quality scoring with the best embedding backend available.
+    "full": MetricProfile("full"),
+}
+DEFAULT_PROFILE = "full"
 
 
 def _looks_like_json(block: str) -> bool:
-    stripped = block.strip()
-    if not stripped:
-        return False
-    if not (
-        (stripped.startswith("{") and stripped.endswith("}"))
-        or (stripped.startswith("[") and stripped.endswith("]"))
-    ):
-        return False
-    try:
-        json.loads(stripped)
-        return True
-    except Exception:
-        return False
+    return _parse_json_block(block) is not _NOT_JSON
+
+
+_TOKEN_RUN_RE = re.compile(r"[a-zA-Z0-9']+")
+_TOKEN_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'")
 
 
 def _tokenize(text: str) -> List[str]:
-    return re.findall(r"[a-zA-Z0-9']+", text.lower())
+    return _TOKEN_RUN_RE.findall(text.lower())
 
 
 def _trigram_embedding(text: str) -> Dict[str, float]:
@@ -120,37 +215,356 @@ def _cosine_similarity(vec_a: Dict[str, float], vec_b: Dict[str, float]) -> floa
     return sum(vec_a[k] * vec_b[k] for k in shared)
 
 
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class TrigramBackend:
+    """Deterministic fallback: cosine similarity of character-trigram counts."""
+
+    name = "trigram-fallback"
+    fingerprint = name
+
+    def similarities(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        return [_cosine_similarity(_trigram_embedding(a), _trigram_embedding(b)) for a, b in pairs]
+
+
+class HashedTrigramBackend:
+    """Vectorized ``trigram-fallback``: trigrams feature-hashed into ``2**bits`` buckets.
+
+    Each text becomes a sparse count vector over hashed trigram ids. All
+    pairs of a batch are scored together: one sort merges the vectors and
+    ``bincount`` reduces dot products and norms. A hash collision merges two
+    trigrams: that can add to the dot product but also inflates the norms,
+    so a score may land on either side of the exact ``trigram-fallback``
+    cosine. The error shrinks as ``bits`` grows; with the default 20 bits
+    the two agree to within 1e-6 on every pair of the eval datasets, well
+    below the 0.1 point rounding of semantic_similarity. Needs NumPy.
+    """
+
+    name = "trigram-hashed"
+
+    # Code points are below 2**21, so three of them pack into one uint64
+    # key; 0x1FFFFF pads inputs shorter than a trigram.
+    _PAD = 0x1FFFFF
+    _GOLDEN = 0x9E3779B97F4A7C15
+
+    def __init__(self, bits: int = 20) -> None:
+        if np is None:
+            raise ImportError("trigram-hashed needs numpy")
+        self.bits = bits
+        self.fingerprint = f"{self.name}:bits={bits}"
+
+    def _features(self, text: str) -> Any:
+        normalized = re.sub(r"\s+", " ", text.lower()).strip()
+        codes = np.frombuffer(normalized.encode("utf-32-le", "surrogatepass"), dtype=np.uint32).astype(np.uint64)
+        if 0 < len(codes) < 3:
+            codes = np.concatenate([codes, np.full(3 - len(codes), self._PAD, dtype=np.uint64)])
+        keys = (codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:]
+        return (keys * np.uint64(self._GOLDEN)) >> np.uint64(64 - self.bits)
+
+    def similarities(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        if not pairs:
+            return []
+        # Sort key: pair index | hashed trigram | side, so the two sides of a
+        # shared trigram end up adjacent after np.unique.
+        shift = np.uint64(self.bits + 1)
+        parts = []
+        for index, pair in enumerate(pairs):
+            for side, text in enumerate(pair):
+                hashed = self._features(text)
+                parts.append((np.uint64(index) << shift) | (hashed << np.uint64(1)) | np.uint64(side))
+        keys, counts = np.unique(np.concatenate(parts), return_counts=True)
+        counts = counts.astype(np.float64)
+        count = len(pairs)
+
+        rows = ((keys >> shift) << np.uint64(1)) | (keys & np.uint64(1))
+        norms = np.sqrt(np.bincount(rows.astype(np.intp), weights=counts * counts, minlength=2 * count))
+        shared = (keys[1:] >> np.uint64(1)) == (keys[:-1] >> np.uint64(1))
+        dots = np.bincount(
+            (keys[:-1][shared] >> shift).astype(np.intp),
+            weights=counts[:-1][shared] * counts[1:][shared],
+            minlength=count,
+        )
+        denominator = norms[0::2] * norms[1::2]
+        scores = np.divide(dots, denominator, out=np.zeros(count), where=denominator > 0)
+        return scores.tolist()
+
+
+class SentenceTransformerBackend:
+    """``sentence-transformers`` model, loaded once when the backend is created."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, batch_size: int = 64) -> None:
+        from sentence_transformers import SentenceTransformer, util  # type: ignore
+
+        self._model = SentenceTransformer(model_name)
+        self._util = util
+        self.batch_size = batch_size
+        self.fingerprint = f"{self.name}:{model_name}"
+
+    def encode(self, texts: Sequence[str]) -> Any:
+        return self._model.encode(list(texts), batch_size=self.batch_size, convert_to_tensor=True)
+
+    def similarities(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        if not pairs:
+            return []
+        emb = self.encode([a for a, _ in pairs] + [b for _, b in pairs])
+        count = len(pairs)
+        return [float(score) for score in self._util.pairwise_cos_sim(emb[:count], emb[count:]).tolist()]
+
+
+# Embedding backends in order of preference. Each factory runs at most once
+# per process; the backend it built, or the error it raised, is remembered.
+# NTF_EMBEDDING_BACKEND names a backend to prefer (e.g. on CPU-only nodes).
+# trigram-hashed comes after the exact fallback, so it only answers when a
+# profile or NTF_EMBEDDING_BACKEND asks for it.
+_EMBEDDING_FACTORIES: Dict[str, Callable[[], Any]] = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    TrigramBackend.name: TrigramBackend,
+    HashedTrigramBackend.name: HashedTrigramBackend,
+}
+_EMBEDDING_BACKENDS: Dict[str, Any] = {}
+_EMBEDDING_ERRORS: Dict[str, str] = {}
+_EMBEDDING_LOCK = threading.Lock()
+
+
+def register_embedding_backend(name: str, factory: Callable[[], Any], preferred: bool = False) -> None:
+    """Add (or replace) a backend factory; ``preferred`` tries it before all others."""
+    with _EMBEDDING_LOCK:
+        _EMBEDDING_FACTORIES.pop(name, None)
+        _EMBEDDING_BACKENDS.pop(name, None)
+        _EMBEDDING_ERRORS.pop(name, None)
+        others = list(_EMBEDDING_FACTORIES.items())
+        if preferred:
+            _EMBEDDING_FACTORIES.clear()
+            _EMBEDDING_FACTORIES[name] = factory
+            _EMBEDDING_FACTORIES.update(others)
+        else:
+            _EMBEDDING_FACTORIES[name] = factory
+
+
+def _mark_backend_failed(name: str, exc: BaseException) -> None:
+    with _EMBEDDING_LOCK:
+        _EMBEDDING_BACKENDS.pop(name, None)
+        _EMBEDDING_ERRORS[name] = f"{type(exc).__name__}: {exc}"
+
+
+def embedding_backend(name: Union[str, Sequence[str], None] = None) -> Any:
+    """The named backend, the first of several names that loads, or the first in preference order."""
+    if name is None:
+        preferred = os.environ.get("NTF_EMBEDDING_BACKEND")
+        requested = [preferred] if preferred else []
+    else:
+        requested = [name] if isinstance(name, str) else list(name)
+    with _EMBEDDING_LOCK:
+        for candidate in requested:
+            if candidate not in _EMBEDDING_FACTORIES:
+                raise ValueError(f"unknown embedding backend {candidate!r}")
+        candidates = requested if name is not None else requested + list(_EMBEDDING_FACTORIES)
+        for candidate in candidates:
+            backend = _EMBEDDING_BACKENDS.get(candidate)
+            if backend is not None:
+                return backend
+            if candidate in _EMBEDDING_ERRORS:
+                continue
+            try:
+                backend = _EMBEDDING_FACTORIES[candidate]()
+            except Exception as exc:
+                _EMBEDDING_ERRORS[candidate] = f"{type(exc).__name__}: {exc}"
+                continue
+            _EMBEDDING_BACKENDS[candidate] = backend
+            return backend
+    raise RuntimeError(f"no embedding backend available: {_EMBEDDING_ERRORS}")
+
+
+def embedding_backend_status() -> Dict[str, str]:
+    """``loaded``, ``failed: <error>`` or ``not loaded`` per registered backend."""
+    with _EMBEDDING_LOCK:
+        return {
+            name: "loaded"
+            if name in _EMBEDDING_BACKENDS
+            else f"failed: {_EMBEDDING_ERRORS[name]}"
+            if name in _EMBEDDING_ERRORS
+            else "not loaded"
+            for name in _EMBEDDING_FACTORIES
+        }
+
+
+def embedding_similarities(
+    pairs: Iterable[Tuple[str, str]],
+    backend: Union[str, Sequence[str], None] = None,
+) -> List[Dict[str, Any]]:
+    """Semantic similarity for many ``(original, decoded)`` pairs in one backend call.
+
+    ``backend`` is passed to ``embedding_backend``. If a backend chosen from
+    a preference order raises ``ImportError`` or ``OSError`` at encode time
+    (a broken model install), it is marked failed and the next one takes
+    over, so the process degrades to the trigram fallback once instead of on
+    every call. Any other error is blamed on the input: the next backend
+    answers this call only and the failing one stays available.
+    """
+    pairs = list(pairs)
+    if backend is None:
+        preferred = os.environ.get("NTF_EMBEDDING_BACKEND")
+        order: Union[str, List[str]] = ([preferred] if preferred else []) + list(_EMBEDDING_FACTORIES)
+    else:
+        order = backend if isinstance(backend, str) else list(backend)
+    while True:
+        chosen = embedding_backend(order)
+        try:
+            scores = chosen.similarities(pairs)
+        except Exception as exc:
+            if isinstance(order, str) or isinstance(chosen, TrigramBackend):
+                raise
+            if isinstance(exc, (ImportError, OSError)):
+                _mark_backend_failed(chosen.name, exc)
+                continue
+            remaining = order[order.index(chosen.name) + 1 :]
+            if not remaining:
+                raise
+            order = remaining
+            continue
+        return [
+            {"semantic_similarity": max(0.0, min(100.0, score * 100.0)), "semantic_backend": chosen.name}
+            for score in scores
+        ]
+
+
 def _embedding_similarity(original: str, decoded: str) -> Dict[str, Any]:
     """Model-like semantic similarity with optional transformer backend and deterministic fallback."""
-    try:
-        from sentence_transformers import SentenceTransformer, util  # type: ignore
+    return embedding_similarities([(original, decoded)])[0]
+
+
+# Combined length (original + decoded) up to which char_similarity runs
+# SequenceMatcher over the whole strings; about 50 ms at the limit. Larger
+# inputs are compared chunk by chunk, CHAR_SIMILARITY_CHUNK chars per pair.
+CHAR_SIMILARITY_BUDGET = 16_000
+CHAR_SIMILARITY_CHUNK = 4_000
+
+
+def _matched_chars(a: str, b: str) -> int:
+    return sum(block.size for block in difflib.SequenceMatcher(None, a, b).get_matching_blocks())
+
+
+def char_similarity(original: str, decoded: str, budget: int = CHAR_SIMILARITY_BUDGET) -> Dict[str, Any]:
+    """SequenceMatcher ratio of the two strings with bounded cost, in percent.
+
+    Inputs within ``budget`` characters get the exact ratio (source
+    ``exact``). Larger inputs drop their common prefix and suffix, which
+    always match; if the rest fits the budget, SequenceMatcher runs on it
+    alone (``trimmed``). Otherwise the rest is cut into proportionally
+    aligned chunk pairs compared independently (``chunked``), which costs
+    linear time and misses matches that cross chunk boundaries. For both
+    approximations the margin is the gap to the character-count upper bound:
+    no alignment matches more of a character than the smaller of its two
+    counts, so a best alignment scores at most ``margin`` points higher.
+    """
+    total = len(original) + len(decoded)
+    if not total:
+        return {"char_similarity": 100.0, "char_similarity_source": "exact", "char_similarity_margin": 0.0}
+    if total <= budget:
+        ratio = difflib.SequenceMatcher(None, original, decoded).ratio()
+        return {"char_similarity": ratio * 100, "char_similarity_source": "exact", "char_similarity_margin": 0.0}
+
+    limit = min(len(original), len(decoded))
+    head = 0
+    while head < limit and original[head] == decoded[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and original[-1 - tail] == decoded[-1 - tail]:
+        tail += 1
+    core_a = original[head : len(original) - tail]
+    core_b = decoded[head : len(decoded) - tail]
+
+    if len(core_a) + len(core_b) <= budget:
+        source = "trimmed"
+        matched = _matched_chars(core_a, core_b)
+    else:
+        source = "chunked"
+        chunks = -(-(len(core_a) + len(core_b)) // CHAR_SIMILARITY_CHUNK)
+        cuts_a = [len(core_a) * i // chunks for i in range(chunks + 1)]
+        cuts_b = [len(core_b) * i // chunks for i in range(chunks + 1)]
+        matched = sum(
+            _matched_chars(core_a[cuts_a[i] : cuts_a[i + 1]], core_b[cuts_b[i] : cuts_b[i + 1]])
+            for i in range(chunks)
+        )
+
+    anchored = head + tail
+    upper = anchored + sum((Counter(core_a) & Counter(core_b)).values())
+    estimate = anchored + matched
+    return {
+        "char_similarity": 200.0 * estimate / total,
+        "char_similarity_source": source,
+        "char_similarity_margin": 200.0 * (upper - estimate) / total,
+    }
 
-        model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-        emb = model.encode([original, decoded], convert_to_tensor=True)
-        score = float(util.cos_sim(emb[0], emb[1]).item())
-        return {"semantic_similarity": max(0.0, min(100.0, score * 100.0)), "semantic_backend": "sentence-transformers"}
-    except Exception:
-        vec_o = _trigram_embedding(original)
-        vec_d = _trigram_embedding(decoded)
-        score = _cosine_similarity(vec_o, vec_d)
-        return {"semantic_similarity": max(0.0, min(100.0, score * 100.0)), "semantic_backend": "trigram-fallback"}
-
-
-def _rdf_score(original: str, decoded: str) -> Dict[str, Any]:
-    """Roundtrip Decode Fidelity using lexical, sequence, and semantic overlap."""
-    orig_tokens = _tokenize(original)
-    dec_tokens = _tokenize(decoded)
-    if not orig_tokens:
+
+def _rdf_score(
+    original: str,
+    decoded: str,
+    semantic_info: Optional[Dict[str, Any]] = None,
+    instrument: Any = NULL_INSTRUMENTATION,
+) -> Dict[str, Any]:
+    """Roundtrip Decode Fidelity using lexical, sequence, and semantic overlap.
+
+    ``semantic_info`` is a precomputed ``embedding_similarities`` entry for the
+    pair, so batch callers can embed many documents in one call.
+    """
+    with instrument.stage("rdf.lexical", (original, decoded)):
+        orig_tokens = _tokenize(original)
+        dec_tokens = _tokenize(decoded)
+        lexical = _lexical_overlap(orig_tokens, dec_tokens)
+    if lexical is None:
         return {
             "rdf": 100.0,
             "token_recall": 100.0,
             "token_jaccard": 100.0,
             "char_similarity": 100.0,
+            "char_similarity_source": "exact",
+            "char_similarity_margin": 0.0,
             "semantic_overlap": 100.0,
             "semantic_similarity": 100.0,
             "semantic_backend": "empty-input",
+            "short_circuit": False,
         }
 
+    token_recall, token_jaccard, semantic_overlap = lexical
+
+    with instrument.stage("rdf.char_similarity", (original, decoded)):
+        char_info = char_similarity(original, decoded)
+    char_score = char_info["char_similarity"]
+
+    if semantic_info is None:
+        with instrument.stage("rdf.embedding", (original, decoded)):
+            semantic_info = _embedding_similarity(original, decoded)
+    semantic_similarity = semantic_info["semantic_similarity"]
+
+    rdf = (
+        (token_recall * 0.45)
+        + (token_jaccard * 0.2)
+        + (char_score * 0.15)
+        + (semantic_overlap * 0.05)
+        + (semantic_similarity * 0.15)
+    )
+    return {
+        "rdf": round(rdf, 1),
+        "token_recall": round(token_recall, 1),
+        "token_jaccard": round(token_jaccard, 1),
+        "char_similarity": round(char_score, 1),
+        "char_similarity_source": char_info["char_similarity_source"],
+        "char_similarity_margin": round(char_info["char_similarity_margin"], 1),
+        "semantic_overlap": round(semantic_overlap, 1),
+        "semantic_similarity": round(semantic_similarity, 1),
+        "semantic_backend": semantic_info["semantic_backend"],
+        "short_circuit": False,
+    }
+
+
+def _lexical_overlap(orig_tokens: List[str], dec_tokens: List[str]) -> Optional[Tuple[float, float, float]]:
+    """Token recall, token Jaccard and SEMANTIC_GROUPS overlap in percent; None without tokens."""
+    if not orig_tokens:
+        return None
     dec_set = set(dec_tokens)
     hit = sum(1 for t in orig_tokens if t in dec_set)
     token_recall = (hit / len(orig_tokens)) * 100
@@ -159,34 +573,37 @@ def _rdf_score(original: str, decoded: str) -> Dict[str, Any]:
     union = len(orig_set | dec_set) or 1
     token_jaccard = (len(orig_set & dec_set) / union) * 100
 
-    char_similarity = difflib.SequenceMatcher(None, original, decoded).ratio() * 100
-
-    orig_set = set(orig_tokens)
-    dec_set = set(dec_tokens)
     semantic_hits = 0
     for words in SEMANTIC_GROUPS.values():
         if words & orig_set and words & dec_set:
             semantic_hits += 1
     semantic_overlap = (semantic_hits / len(SEMANTIC_GROUPS)) * 100
+    return token_recall, token_jaccard, semantic_overlap
 
-    semantic_info = _embedding_similarity(original, decoded)
-    semantic_similarity = semantic_info["semantic_similarity"]
 
-    rdf = (
-        (token_recall * 0.45)
-        + (token_jaccard * 0.2)
-        + (char_similarity * 0.15)
-        + (semantic_overlap * 0.05)
-        + (semantic_similarity * 0.15)
-    )
+def _identity_rdf(original: str) -> Dict[str, Any]:
+    """``_rdf_score`` for a decode that reproduces ``original``: every overlap scorer is 100.
+
+    Only semantic_overlap depends on the input (the SEMANTIC_GROUPS it
+    mentions), so it is the one measure computed.
+    """
+    orig_set = set(_tokenize(original))
+    if not orig_set:
+        return _rdf_score(original, original)
+    semantic_hits = sum(1 for words in SEMANTIC_GROUPS.values() if words & orig_set)
+    semantic_overlap = (semantic_hits / len(SEMANTIC_GROUPS)) * 100
+    rdf = 100.0 * (0.45 + 0.2 + 0.15 + 0.15) + semantic_overlap * 0.05
     return {
         "rdf": round(rdf, 1),
-        "token_recall": round(token_recall, 1),
-        "token_jaccard": round(token_jaccard, 1),
-        "char_similarity": round(char_similarity, 1),
+        "token_recall": 100.0,
+        "token_jaccard": 100.0,
+        "char_similarity": 100.0,
+        "char_similarity_source": "identity",
+        "char_similarity_margin": 0.0,
         "semantic_overlap": round(semantic_overlap, 1),
-        "semantic_similarity": round(semantic_similarity, 1),
-        "semantic_backend": semantic_info["semantic_backend"],
+        "semantic_similarity": 100.0,
+        "semantic_backend": "identity",
+        "short_circuit": True,
     }
 
 
@@ -204,6 +621,8 @@ def _code_ast_check(seg: Segment) -> bool:
             return False
 
     if lang == "json":
+        # Only blocks that did not parse as an object or array get here:
+        # scalars are valid JSON, anything else is not.
         try:
             json.loads(content)
             return True
@@ -260,10 +679,9 @@ def _scs_score(segments: List[Segment], decoded: str) -> Dict[str, float]:
         elif seg.kind == "json":
             total += 1
             try:
-                canon = json.dumps(json.loads(seg.content), ensure_ascii=False, sort_keys=True)
-                if canon in decoded:
+                if seg.canonical_json in decoded:
                     passed += 1
-            except Exception:
+            except ValueError:
                 pass
 
     if total == 0:
@@ -279,52 +697,464 @@ def _scs_score(segments: List[Segment], decoded: str) -> Dict[str, float]:
     }
 
 
-def _scan_security(text: str) -> Dict[str, Any]:
-    lowered = text.lower()
-
-    marker_hits = [m for m in INJECTION_MARKERS if m in lowered]
-    marker_penalty = sum(INJECTION_MARKERS[m] for m in marker_hits) * 0.5
-
-    imperative_cues = ["must", "now", "immediately", "ignore", "reveal", "bypass", "override"]
-    imperative_score = 0
-    for marker in marker_hits:
-        idx = lowered.find(marker)
-        window = lowered[max(0, idx - 80) : idx + 80] if idx >= 0 else ""
-        imperative_score += sum(1.5 for cue in imperative_cues if cue in window)
-
-    pattern_hits: Dict[str, int] = {}
-    pattern_penalty = 0
-    for name, (regex, weight) in SENSITIVE_PATTERNS.items():
-        matches = regex.findall(text)
-        count = len(matches)
-        if count:
-            pattern_hits[name] = count
-            pattern_penalty += min(20, count * weight * 0.6)
-
-    token_count = max(1, len(_tokenize(text)))
-    marker_density = (len(marker_hits) / token_count) * 1000
-    density_penalty = min(8.0, marker_density * 0.4)
-
-    risk_score = min(100.0, marker_penalty + pattern_penalty + imperative_score + density_penalty)
-    ssr = round(max(0.0, 100.0 - risk_score), 1)
-
-    if ssr >= 85:
-        level = "low"
-    elif ssr >= 60:
-        level = "medium"
-    else:
-        level = "high"
+class SecurityRules:
+    """``INJECTION_MARKERS``, ``IMPERATIVE_CUES`` and ``SENSITIVE_PATTERNS`` compiled for scanning.
+
+    Produces exactly the report of the straightforward scan (one substring
+    search per marker, a cue search in the 160-char window of every hit,
+    one ``findall`` per pattern, a full tokenization for density) while
+    skipping work that cannot change it:
+
+    * markers are located with C-level ``str.find`` in the lowered text once;
+    * cues are looked up only inside the windows of marker hits;
+    * the text is tokenized only when a marker hit makes density non-zero;
+    * a pattern listed in ``prefilters`` runs only if the lowered text holds
+      one of its literals. Every match must contain one of them, and the
+      check is applied to ASCII text only, where ``re.I`` matching and
+      ``str.lower`` agree.
+
+    The module tables are compiled at import; build a new ``SecurityRules``
+    after editing them.
+    """
+
+    def __init__(
+        self,
+        markers: Optional[Dict[str, int]] = None,
+        cues: Sequence[str] = IMPERATIVE_CUES,
+        patterns: Optional[Dict[str, Tuple[Pattern, int]]] = None,
+        prefilters: Optional[Dict[str, Tuple[str, ...]]] = None,
+    ) -> None:
+        self.markers = dict(INJECTION_MARKERS if markers is None else markers)
+        self.cues = tuple(cues)
+        self.patterns = dict(SENSITIVE_PATTERNS if patterns is None else patterns)
+        self.prefilters = {
+            name: tuple(literal.lower() for literal in literals)
+            for name, literals in (SENSITIVE_PREFILTERS if prefilters is None else prefilters).items()
+            if name in self.patterns
+        }
 
-    return {
-        "marker_hits": marker_hits,
-        "marker_count": len(marker_hits),
-        "pattern_hits": pattern_hits,
-        "imperative_score": imperative_score,
-        "marker_density": round(marker_density, 3),
-        "risk_score": round(risk_score, 1),
-        "risk_level": level,
-        "ssr": ssr,
-    }
+    def _marker_positions(self, lowered: str) -> Dict[str, int]:
+        """First offset of every marker found in ``lowered``, in table order."""
+        found = {}
+        for marker in self.markers:
+            idx = lowered.find(marker)
+            if idx >= 0:
+                found[marker] = idx
+        return found
+
+    def _pattern_counts(self, text: str, lowered: str) -> Dict[str, int]:
+        prefilters = self.prefilters if text.isascii() else {}
+        counts = {}
+        for name, (regex, _) in self.patterns.items():
+            literals = prefilters.get(name)
+            if literals is not None and not any(literal in lowered for literal in literals):
+                continue
+            count = len(regex.findall(text))
+            if count:
+                counts[name] = count
+        return counts
+
+    def _imperative_score(self, lowered: str, first: Dict[str, int]) -> float:
+        imperative_score = 0
+        for idx in first.values():
+            window = lowered[max(0, idx - 80) : idx + 80]
+            imperative_score += sum(1.5 for cue in self.cues if cue in window)
+        return imperative_score
+
+    def scan(self, text: str) -> Dict[str, Any]:
+        lowered = text.lower()
+        first = self._marker_positions(lowered)
+        # Density is zero without marker hits, so only then is the text tokenized.
+        tokens = len(_tokenize(text)) if first else 0
+        return self._report(first, self._imperative_score(lowered, first), self._pattern_counts(text, lowered), tokens)
+
+    def _report(
+        self,
+        first: Dict[str, int],
+        imperative_score: float,
+        counts: Dict[str, int],
+        tokens: int,
+    ) -> Dict[str, Any]:
+        marker_hits = list(first)
+        marker_penalty = sum(self.markers[m] for m in marker_hits) * 0.5
+
+        pattern_hits: Dict[str, int] = {}
+        pattern_penalty = 0
+        for name, (_, weight) in self.patterns.items():
+            count = counts.get(name, 0)
+            if count:
+                pattern_hits[name] = count
+                pattern_penalty += min(20, count * weight * 0.6)
+
+        token_count = max(1, tokens)
+        marker_density = (len(marker_hits) / token_count) * 1000
+        density_penalty = min(8.0, marker_density * 0.4)
+
+        risk_score = min(100.0, marker_penalty + pattern_penalty + imperative_score + density_penalty)
+        ssr = round(max(0.0, 100.0 - risk_score), 1)
+
+        if ssr >= 85:
+            level = "low"
+        elif ssr >= 60:
+            level = "medium"
+        else:
+            level = "high"
+
+        return {
+            "marker_hits": marker_hits,
+            "marker_count": len(marker_hits),
+            "pattern_hits": pattern_hits,
+            "imperative_score": imperative_score,
+            "marker_density": round(marker_density, 3),
+            "risk_score": round(risk_score, 1),
+            "risk_level": level,
+            "ssr": ssr,
+        }
+
+
+_SECURITY_RULES = SecurityRules()
+
+
+class SecurityScanner:
+    """Incremental ``SecurityRules.scan`` over a chunked stream.
+
+    ``feed`` returns the report for the text seen so far, so a proxy can act
+    on the running ``risk_score``. With a ``threshold``, the scanner sets
+    ``terminated`` as soon as the running risk reaches it and refuses
+    further input. ``close`` returns the final report, identical to
+    ``scan`` of the whole text when every sensitive-pattern match is
+    shorter than ``margin`` characters.
+
+    Memory stays bounded. The scanner keeps the lowered text needed for
+    markers that cross a chunk boundary and for the +-80-char cue windows
+    of marker hits still open. It also keeps ``margin`` chars of raw text
+    so a pattern match near the end can still grow. Matches longer than
+    ``margin`` are counted once they reach that length. Until then the
+    running report counts the leftmost pending match of each pattern
+    provisionally.
+
+    Sensitive patterns are re-run only once a quarter of ``margin`` new
+    chars has arrived, so small chunks do not rescan the retained margin
+    on every feed. Between those passes the running report's pattern hits
+    lag behind by less than that; markers and cues are always current.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[SecurityRules] = None,
+        threshold: Optional[float] = None,
+        margin: int = 1024,
+    ) -> None:
+        self.rules = rules if rules is not None else _SECURITY_RULES
+        self.threshold = threshold
+        self.margin = margin
+        self.terminated = False
+        self.closed = False
+        self.length = 0
+        self._overlap = max((len(m) for m in self.rules.markers), default=1) - 1
+        self._first: Dict[str, int] = {}
+        self._scores: Dict[str, float] = {}
+        self._lowered = ""
+        self._lowered_start = 0
+        self._tokens = 0
+        self._in_token = False
+        self._text = ""
+        self._text_start = 0
+        self._next: Dict[str, int] = {name: 0 for name in self.rules.patterns}
+        self._counts: Dict[str, int] = {}
+        self._pending: Dict[str, int] = {}
+        self._scanned = 0
+        self._pass_every = max(1, margin // 4)
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        if self.closed:
+            raise ValueError("security scanner is closed")
+        if self.terminated:
+            raise ValueError(f"security scanner terminated: risk reached {self.threshold}")
+        lowered = chunk.lower()
+        self._feed_markers(lowered)
+        self._feed_tokens(lowered)
+        self._text += chunk
+        self.length += len(lowered)
+        if self.length - self._scanned >= self._pass_every:
+            self._pending = self._feed_patterns(final=False)
+            self._scanned = self.length
+        report = self._running(self._pending)
+        if self.threshold is not None and report["risk_score"] >= self.threshold:
+            self.terminated = True
+        self._trim()
+        return report
+
+    def close(self) -> Dict[str, Any]:
+        if not self.closed:
+            self._feed_patterns(final=True)
+            self.closed = True
+        return self._running({}, final=True)
+
+    def _feed_markers(self, lowered: str) -> None:
+        base = self._lowered_start
+        self._lowered += lowered
+        # Only the last len(marker) - 1 old chars can start a new occurrence.
+        search_from = max(0, self.length - self._overlap) - base
+        for marker in self.rules.markers:
+            if marker not in self._first:
+                idx = self._lowered.find(marker, search_from)
+                if idx >= 0:
+                    self._first[marker] = base + idx
+
+    def _feed_tokens(self, lowered: str) -> None:
+        runs = _TOKEN_RUN_RE.findall(lowered)
+        if runs:
+            self._tokens += len(runs) - (self._in_token and lowered[:1] in _TOKEN_CHARS)
+        if lowered:
+            self._in_token = lowered[-1] in _TOKEN_CHARS
+
+    def _feed_patterns(self, final: bool) -> Dict[str, int]:
+        """Count settled matches; return the provisional leftmost match per pattern."""
+        text, start = self._text, self._text_start
+        settle_before = len(text) if final else len(text) - self.margin
+        pending: Dict[str, int] = {}
+        for name, (regex, _) in self.rules.patterns.items():
+            pos = self._next[name] - start
+            while True:
+                match = regex.search(text, pos)
+                if match is None:
+                    self._next[name] = start + max(pos, settle_before)
+                    break
+                if match.end() > settle_before and match.end() - match.start() < self.margin:
+                    self._next[name] = start + match.start()
+                    pending[name] = 1
+                    break
+                self._counts[name] = self._counts.get(name, 0) + 1
+                pos = max(match.end(), match.start() + 1)
+        return pending
+
+    def _window_score(self, idx: int, final: bool) -> Tuple[float, bool]:
+        low, high = max(0, idx - 80), idx + 80
+        window = self._lowered[low - self._lowered_start : high - self._lowered_start]
+        return sum(1.5 for cue in self.rules.cues if cue in window), final or self.length >= high
+
+    def _running(self, pending: Dict[str, int], final: bool = False) -> Dict[str, Any]:
+        imperative_score = 0
+        for marker, idx in self._first.items():
+            score = self._scores.get(marker)
+            if score is None:
+                score, settled = self._window_score(idx, final)
+                if settled:
+                    self._scores[marker] = score
+            imperative_score += score
+        first = {m: self._first[m] for m in self.rules.markers if m in self._first}
+        counts = dict(self._counts)
+        for name in pending:
+            counts[name] = counts.get(name, 0) + 1
+        tokens = self._tokens if first else 0
+        return self.rules._report(first, imperative_score, counts, tokens)
+
+    def _trim(self) -> None:
+        # A marker found later starts in the last len(marker) - 1 chars and
+        # needs 80 chars before it; open windows need theirs too.
+        keep = self.length - self._overlap - 80
+        for marker, idx in self._first.items():
+            if marker not in self._scores:
+                keep = min(keep, idx - 80)
+        keep = max(self._lowered_start, keep)
+        self._lowered = self._lowered[keep - self._lowered_start :]
+        self._lowered_start = keep
+
+        # One extra char keeps the context for a leading \b.
+        end = self._text_start + len(self._text)
+        cut = max(self._text_start, min(self._next.values(), default=end) - 1)
+        self._text = self._text[cut - self._text_start :]
+        self._text_start = cut
+
+
+def _scan_security(text: str) -> Dict[str, Any]:
+    return _SECURITY_RULES.scan(text)
+
+
+def _json_segment(content: str, parsed: Any, language: str = "") -> Segment:
+    seg = Segment(kind="json", content=content, language=language)
+    seg._json = parsed
+    return seg
+
+
+def _prose_segment(block: str) -> Segment:
+    """Text between code fences: a JSON segment if the whole block parses, else text."""
+    parsed = _parse_json_block(block)
+    if parsed is not _NOT_JSON:
+        return _json_segment(block.strip(), parsed)
+    return Segment(kind="text", content=block.strip())
+
+
+def _fence_segment(lang: str, code: str) -> Segment:
+    """A fenced block: JSON if the body parses, else code."""
+    lang = (lang or "").strip().lower()
+    parsed = _parse_json_block(code)
+    if parsed is not _NOT_JSON:
+        return _json_segment(code.strip(), parsed, lang or "json")
+    return Segment(kind="code", content=code.rstrip("\n"), language=lang or "plaintext")
+
+
+# Longest language tag accepted after an opening fence. Real tags are short;
+# the cap bounds how far a stream looks ahead for the opener's newline.
+FENCE_TAG_MAX = 32
+STREAM_MAX_PENDING = 64_000
+
+_FENCE_RE = re.compile(r"```([a-zA-Z0-9_+-]{0,%d})\n(.*?)```" % FENCE_TAG_MAX, re.DOTALL)
+_FENCE_OPEN_RE = re.compile(r"```([a-zA-Z0-9_+-]{0,%d})\n" % FENCE_TAG_MAX)
+_FENCE_LANG_TAIL_RE = re.compile(r"```[a-zA-Z0-9_+-]{0,%d}\Z" % FENCE_TAG_MAX)
+
+
+def _trailing_backticks(text: str) -> int:
+    """Backticks (at most two) ending ``text``: a fence marker may continue in the next chunk."""
+    if text.endswith("``"):
+        return 2
+    return 1 if text.endswith("`") else 0
+
+
+class SegmentStream:
+    """Incremental ``detect_segments`` over chunks arriving from a stream.
+
+    ``feed`` returns the segments that became final: a fenced block as soon
+    as its closing fence arrives, together with the prose before it. Prose
+    is otherwise only final at the next closing fence or at ``close``,
+    because an opening fence that never closes is part of the surrounding
+    text, as in ``detect_segments``.
+
+    Each chunk is scanned once; lookahead across chunk boundaries is a
+    partial fence marker plus at most ``FENCE_TAG_MAX`` tag characters.
+    At most ``max_pending`` characters of prose or fence body are held
+    (None for no bound): longer prose is emitted in pieces cut at
+    whitespace, and a fence whose body outgrows the bound is treated as
+    unterminated and flushed as text. Concatenating every ``feed`` result
+    and ``close()`` gives ``detect_segments`` of the joined chunks, however
+    they are split, as long as no prose run or fence body exceeds
+    ``max_pending``.
+    """
+
+    def __init__(self, max_pending: Optional[int] = STREAM_MAX_PENDING) -> None:
+        self.max_pending = max_pending
+        self._prose: List[str] = []
+        self._prose_size = 0
+        self._fence: Optional[List[str]] = None
+        self._fence_size = 0
+        self._opener = ""
+        self._carry = ""
+        self.closed = False
+
+    @property
+    def pending(self) -> int:
+        """Characters buffered and not yet emitted."""
+        return self._prose_size + self._fence_size + len(self._opener) + len(self._carry)
+
+    def feed(self, chunk: str) -> List[Segment]:
+        if self.closed:
+            raise ValueError("segment stream is closed")
+        out: List[Segment] = []
+        text = self._carry + chunk
+        self._carry = ""
+        pos = 0
+        while True:
+            if self._fence is not None:
+                end = text.find("```", pos)
+                if end < 0:
+                    keep = _trailing_backticks(text[pos:])
+                    self._add_fence(text[pos : len(text) - keep])
+                    self._carry = text[len(text) - keep :]
+                    break
+                self._add_fence(text[pos:end])
+                self._emit_fence(out)
+                pos = end + 3
+                continue
+
+            start = text.find("```", pos)
+            while start >= 0:
+                opener = _FENCE_OPEN_RE.match(text, start)
+                if opener is not None or _FENCE_LANG_TAIL_RE.match(text, start):
+                    break
+                start = text.find("```", start + 1)
+            if start < 0:
+                keep = _trailing_backticks(text[pos:])
+                self._add_prose(text[pos : len(text) - keep])
+                self._carry = text[len(text) - keep :]
+                break
+            self._add_prose(text[pos:start])
+            if opener is None:
+                # "```lang" reaches the end of the chunk: undecided until the newline.
+                self._carry = text[start:]
+                break
+            self._fence = []
+            self._opener = opener.group(0)
+            pos = opener.end()
+        self._settle(out)
+        return out
+
+    def _add_prose(self, text: str) -> None:
+        if text:
+            self._prose.append(text)
+            self._prose_size += len(text)
+
+    def _add_fence(self, text: str) -> None:
+        if text and self._fence is not None:
+            self._fence.append(text)
+            self._fence_size += len(text)
+
+    def _settle(self, out: List[Segment]) -> None:
+        """Enforce ``max_pending`` on the buffered prose and fence body."""
+        limit = self.max_pending
+        if limit is None:
+            return
+        if self._fence is not None and self._fence_size > limit:
+            # Too long to wait for a closing fence: from here on it is text.
+            self._add_prose(self._opener)
+            for part in self._fence:
+                self._add_prose(part)
+            self._fence, self._fence_size, self._opener = None, 0, ""
+        if self._fence is not None or self._prose_size <= limit:
+            return
+        prose = "".join(self._prose)
+        cut = max(prose.rfind(" "), prose.rfind("\n"), prose.rfind("\t")) + 1
+        if cut <= 0 or len(prose) - cut > limit // 2:
+            cut = len(prose)
+        if prose[:cut].strip():
+            out.append(_prose_segment(prose[:cut]))
+        rest = prose[cut:]
+        self._prose = [rest] if rest else []
+        self._prose_size = len(rest)
+
+    def _emit_fence(self, out: List[Segment]) -> None:
+        pre = "".join(self._prose)
+        if pre.strip():
+            out.append(_prose_segment(pre))
+        lang = self._opener[3:-1]
+        out.append(_fence_segment(lang, "".join(self._fence or ())))
+        self._prose, self._prose_size = [], 0
+        self._fence, self._fence_size = None, 0
+        self._opener = ""
+
+    def close(self) -> List[Segment]:
+        """Finish the stream; an unclosed fence is returned as part of the trailing text."""
+        if self.closed:
+            return []
+        self.closed = True
+        parts = self._prose
+        if self._fence is not None:
+            parts = parts + [self._opener] + self._fence
+        tail = "".join(parts) + self._carry
+        self._prose, self._fence, self._carry, self._opener = [], None, "", ""
+        self._prose_size = self._fence_size = 0
+        return [_prose_segment(tail)] if tail.strip() else []
+
+
+def detect_segments_stream(
+    chunks: Iterable[str],
+    max_pending: Optional[int] = STREAM_MAX_PENDING,
+) -> Iterator[Segment]:
+    """Yield ``detect_segments`` output incrementally from a chunked source."""
+    stream = SegmentStream(max_pending=max_pending)
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    yield from stream.close()
 
 
 def detect_segments(input_text: str) -> List[Segment]:
@@ -332,39 +1162,55 @@ def detect_segments(input_text: str) -> List[Segment]:
     segments: List[Segment] = []
     cursor = 0
 
-    for match in re.finditer(r"```([a-zA-Z0-9_+-]*)\n(.*?)```", input_text, flags=re.DOTALL):
+    for match in _FENCE_RE.finditer(input_text):
         pre = input_text[cursor : match.start()]
         if pre.strip():
-            kind: SegmentType = "json" if _looks_like_json(pre) else "text"
-            segments.append(Segment(kind=kind, content=pre.strip()))
+            segments.append(_prose_segment(pre))
 
-        lang = (match.group(1) or "").strip().lower()
-        code = match.group(2)
-        if _looks_like_json(code):
-            segments.append(Segment(kind="json", content=code.strip(), language=lang or "json"))
-        else:
-            segments.append(Segment(kind="code", content=code.rstrip("\n"), language=lang or "plaintext"))
+        segments.append(_fence_segment(match.group(1), match.group(2)))
         cursor = match.end()
 
     tail = input_text[cursor:]
     if tail.strip():
-        kind = "json" if _looks_like_json(tail) else "text"
-        segments.append(Segment(kind=kind, content=tail.strip()))
+        segments.append(_prose_segment(tail))
 
     return segments
 
 
-def compress_segments(segments: List[Segment]) -> Dict[str, Any]:
+def compress_segments(segments: List[Segment], reversible: bool = False) -> Dict[str, Any]:
+    """Compress each segment. ``reversible`` text payloads decode losslessly without an original copy.
+
+    The active vocabulary is read once, so codes and the fingerprint they
+    are tagged with always come from the same table, even across a reload.
+    """
+    vocabulary = active_vocabulary()
     compressed: List[CompressedSegment] = []
 
     for seg in segments:
-        if seg.kind == "text":
-            result = run_ntf(seg.content)
+        if seg.kind == "text" and reversible:
+            result = run_ntf(seg.content, compact=True, vocabulary=vocabulary)
+            compressed.append(
+                CompressedSegment(
+                    kind="text",
+                    language="",
+                    payload=encode_reversible(seg.content, vocabulary),
+                    metadata={
+                        "reversible": True,
+                        "vocabulary": vocabulary.fingerprint,
+                        "compression_x": round((result.original_words / result.compressed_tokens), 2)
+                        if result.compressed_tokens
+                        else 0.0,
+                        "intfr": result.intfr,
+                    },
+                )
+            )
+        elif seg.kind == "text":
+            result = run_ntf(seg.content, compact=True, vocabulary=vocabulary)
             compressed.append(
                 CompressedSegment(
                     kind="text",
                     language="",
-                    payload=" ".join(result.clusters.keys()) if result.clusters else seg.content,
+                    payload=" ".join(result.cluster_counts) if result.cluster_counts else seg.content,
                     metadata={
                         "original": seg.content,
                         "compression_x": round((result.original_words / result.compressed_tokens), 2)
@@ -375,12 +1221,11 @@ def compress_segments(segments: List[Segment]) -> Dict[str, Any]:
                 )
             )
         elif seg.kind == "json":
-            canonical = json.dumps(json.loads(seg.content), ensure_ascii=False, sort_keys=True)
             compressed.append(
                 CompressedSegment(
                     kind="json",
                     language=seg.language or "json",
-                    payload=canonical,
+                    payload=seg.canonical_json,
                     metadata={"canonical": True},
                 )
             )
@@ -395,40 +1240,142 @@ def compress_segments(segments: List[Segment]) -> Dict[str, Any]:
             )
 
     return {
-        "schema": "ntf.multimodal",
-        "version": "0.3",
+        "schema": PIPELINE_SCHEMA,
+        "version": PIPELINE_VERSION,
         "segments": [asdict(s) for s in compressed],
     }
 
 
+def _decode_segment(seg: Dict[str, Any], vocabulary: CompiledVocabulary) -> Optional[str]:
+    kind = seg["kind"]
+    metadata = seg.get("metadata", {})
+    if kind == "text" and metadata.get("reversible"):
+        if metadata.get("vocabulary") != vocabulary.fingerprint:
+            raise ValueError("reversible text segment was encoded with a different vocabulary")
+        return decode_reversible(seg["payload"], vocabulary)
+    if kind == "text":
+        return metadata.get("original", seg["payload"])
+    if kind == "json":
+        return seg["payload"]
+    if kind == "code":
+        lang = seg.get("language", "").strip()
+        return f"```{lang}\n{seg['payload']}\n```"
+    return None
+
+
+def _decode_pieces(payload: Dict[str, Any]) -> List[Tuple[str, str]]:
+    vocabulary = active_vocabulary()
+    pieces = ((seg["kind"], _decode_segment(seg, vocabulary)) for seg in payload.get("segments", []))
+    return [(kind, piece) for kind, piece in pieces if piece is not None]
+
+
 def decode_segments(payload: Dict[str, Any]) -> str:
     """Deterministic decode back into mixed markdown-like text."""
-    out: List[str] = []
-    for seg in payload.get("segments", []):
-        kind = seg["kind"]
-        if kind == "text":
-            out.append(seg.get("metadata", {}).get("original", seg["payload"]))
-        elif kind == "json":
-            out.append(seg["payload"])
-        elif kind == "code":
-            lang = seg.get("language", "").strip()
-            out.append(f"```{lang}\n{seg['payload']}\n```")
-    return "\n\n".join(out).strip()
-
-
-def run_pipeline(input_text: str) -> Dict[str, Any]:
-    segments = detect_segments(input_text)
-    compressed = compress_segments(segments)
-    decoded = decode_segments(compressed)
-
-    rdf_metrics = _rdf_score(input_text, decoded)
-    scs_metrics = _scs_score(segments, decoded)
-    security = _scan_security(input_text)
-
-    metrics = {
-        **rdf_metrics,
-        **scs_metrics,
-    }
+    return "\n\n".join(piece for _, piece in _decode_pieces(payload)).strip()
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(" ".join(text.split()).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def roundtrip_is_identity(input_text: str, pieces: List[Tuple[str, str]]) -> bool:
+    """True when the decode reproduces the input up to whitespace.
+
+    Compares content hashes of the whitespace-normalized texts, so every
+    segment's decode is checked against its own source span, fence line and
+    tag included. A fenced JSON block (decoded without its fence), an
+    untagged fence (decoded as ``plaintext``) or a canonicalized JSON value
+    is never an identity and goes through the full RDF scorers.
+    """
+    return _digest(input_text) == _digest("\n\n".join(piece for _, piece in pieces))
+
+
+def _pipeline_fingerprint(reversible: bool, profile: MetricProfile) -> str:
+    # Every field, so a custom profile reusing a built-in name gets its own entries.
+    scorers = json.dumps(astuple(profile), separators=(",", ":"))
+    key = f"{PIPELINE_VERSION}/{vocabulary_fingerprint()}/r{int(reversible)}/{scorers}"
+    backend = _scoring_backend(profile)
+    if backend is not None:
+        # semantic_similarity depends on the backend that will answer.
+        key += f"/{getattr(backend, 'fingerprint', backend.name)}"
+    return key
+
+
+def _scoring_backend(profile: MetricProfile) -> Any:
+    """The embedding backend ``profile`` scores with, or None when it never embeds."""
+    return embedding_backend(profile.embedding) if profile.rdf == "full" else None
+
+
+def _cacheable(result: Dict[str, Any], backend: Any) -> bool:
+    """False when another backend answered for this input than the cache key names."""
+    answered = result["payload"]["metrics"].get("semantic_backend")
+    return backend is None or answered in (None, backend.name, "identity", "empty-input")
+
+
+def _metric_profile(profile: Union[str, MetricProfile]) -> MetricProfile:
+    if isinstance(profile, MetricProfile):
+        return profile
+    try:
+        return METRIC_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"unknown metric profile {profile!r}; choose from {sorted(METRIC_PROFILES)}") from None
+
+
+def _needs_embedding(input_text: str, identity: bool, profile: MetricProfile) -> bool:
+    return profile.rdf == "full" and not identity and bool(_tokenize(input_text))
+
+
+def _encode_stage(
+    input_text: str,
+    reversible: bool,
+    instrument: Any = NULL_INSTRUMENTATION,
+) -> Tuple[List[Segment], Dict[str, Any], str, bool]:
+    with instrument.stage("detect", input_text) as timer:
+        segments = detect_segments(input_text)
+        timer.output(segments)
+    with instrument.stage("compress", segments) as timer:
+        compressed = compress_segments(segments, reversible=reversible)
+        timer.output(compressed)
+    with instrument.stage("decode", compressed) as timer:
+        pieces = _decode_pieces(compressed)
+        decoded = "\n\n".join(piece for _, piece in pieces).strip()
+        timer.output(decoded)
+    with instrument.stage("identity", (input_text, decoded)):
+        identity = roundtrip_is_identity(input_text, pieces)
+    return segments, compressed, decoded, identity
+
+
+def _score_stage(
+    input_text: str,
+    segments: List[Segment],
+    compressed: Dict[str, Any],
+    decoded: str,
+    identity: bool,
+    semantic_info: Optional[Dict[str, Any]] = None,
+    profile: MetricProfile = METRIC_PROFILES[DEFAULT_PROFILE],
+    instrument: Any = NULL_INSTRUMENTATION,
+) -> Dict[str, Any]:
+    metrics: Dict[str, Any] = {}
+    computed: List[str] = []
+    # A decode that reproduces the input scores 100 on every overlap
+    # measure, so the tokenizer, SequenceMatcher and embedding are skipped.
+    if identity:
+        with instrument.stage("rdf.identity", input_text):
+            metrics.update(_identity_rdf(input_text))
+        computed.append("rdf")
+    elif profile.rdf == "full":
+        if semantic_info is None and _needs_embedding(input_text, identity, profile):
+            with instrument.stage("rdf.embedding", (input_text, decoded)):
+                semantic_info = embedding_similarities([(input_text, decoded)], backend=profile.embedding)[0]
+        metrics.update(_rdf_score(input_text, decoded, semantic_info, instrument))
+        computed.append("rdf")
+    if profile.scs:
+        with instrument.stage("scs", segments):
+            metrics.update(_scs_score(segments, decoded))
+        computed.append("scs")
+    with instrument.stage("security", input_text):
+        security = _scan_security(input_text)
+    computed.append("security")
 
     payload = PipelinePayload(
         schema=compressed["schema"],
@@ -436,6 +1383,8 @@ def run_pipeline(input_text: str) -> Dict[str, Any]:
         segments=[CompressedSegment(**s) for s in compressed["segments"]],
         metrics=metrics,
         security=security,
+        profile=profile.name,
+        metrics_computed=computed,
     )
 
     return {
@@ -446,16 +1395,138 @@ def run_pipeline(input_text: str) -> Dict[str, Any]:
             "segments": [asdict(s) for s in payload.segments],
             "metrics": payload.metrics,
             "security": payload.security,
+            "profile": payload.profile,
+            "metrics_computed": payload.metrics_computed,
         },
         "decoded": decoded,
     }
 
 
+def run_pipeline(
+    input_text: str,
+    cache: Optional[ResultCache] = None,
+    reversible: bool = False,
+    profile: Union[str, MetricProfile] = DEFAULT_PROFILE,
+    instrument: Optional[Instrumentation] = None,
+) -> Dict[str, Any]:
+    """Detect, compress, decode and score ``input_text``.
+
+    ``reversible`` stores text segments with the lossless NTF encoding instead
+    of a compressed summary plus the original text.
+
+    ``profile`` names a ``METRIC_PROFILES`` entry (or is a ``MetricProfile``)
+    selecting the scorers; the payload lists the ones that ran in
+    ``metrics_computed``.
+
+    ``instrument`` records per-stage timings and sizes (see
+    ``ntf_instrument``). With ``attach`` set, they are returned under
+    ``instrumentation`` in a shallow copy of the result.
+
+    With a ``cache``, repeated payloads are served by content hash. The key
+    includes the pipeline version and the NTF vocabulary fingerprint. The
+    returned dict is then shared and must not be mutated.
+    """
+    profile = _metric_profile(profile)
+    tracer = as_instrumentation(instrument)
+    tracer.begin_run()
+    if cache is not None:
+        # Only the lookup and the store are cache stages; a miss records the
+        # pipeline stages beside them, so no time is counted twice.
+        with tracer.stage("cache.get", input_text):
+            key = content_key("pipeline", input_text, _pipeline_fingerprint(reversible, profile))
+            result = cache.get(key)
+        if result is None:
+            result = _run_uncached(input_text, reversible, profile, tracer)
+            with tracer.stage("cache.put"):
+                if _cacheable(result, _scoring_backend(profile)):
+                    cache.put(key, result)
+    else:
+        result = _run_uncached(input_text, reversible, profile, tracer)
+    if tracer.attach:
+        # Copy: cached results are shared and must not carry one run's timings.
+        result = {**result, "instrumentation": tracer.report()}
+    return result
+
+
+def _run_uncached(input_text: str, reversible: bool, profile: MetricProfile, instrument: Any) -> Dict[str, Any]:
+    stages = _encode_stage(input_text, reversible, instrument)
+    return _score_stage(input_text, *stages, profile=profile, instrument=instrument)
+
+
+def run_pipeline_batch(
+    texts: Sequence[str],
+    cache: Optional[ResultCache] = None,
+    reversible: bool = False,
+    profile: Union[str, MetricProfile] = DEFAULT_PROFILE,
+    instrument: Optional[Instrumentation] = None,
+) -> List[Dict[str, Any]]:
+    """``run_pipeline`` over many inputs, embedding all roundtrip pairs in one backend call.
+
+    Results match per-text ``run_pipeline`` calls. Cache hits skip both
+    encoding and embedding; only the misses are sent to the backend, and
+    repeated texts within the batch are computed once. An ``instrument``
+    records the whole batch as one run; the batched embedding is a single
+    ``rdf.embedding`` stage.
+    """
+    profile = _metric_profile(profile)
+    tracer = as_instrumentation(instrument)
+    tracer.begin_run()
+    fingerprint = _pipeline_fingerprint(reversible, profile)
+    backend = _scoring_backend(profile) if cache is not None else None
+    results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+    pending: List[Tuple[int, str, Tuple[List[Segment], Dict[str, Any], str, bool]]] = []
+    duplicates: List[Tuple[int, int]] = []
+    first_index: Dict[str, int] = {}
+    for index, text in enumerate(texts):
+        key = content_key("pipeline", text, fingerprint)
+        if key in first_index:
+            duplicates.append((index, first_index[key]))
+            continue
+        first_index[key] = index
+        hit = None
+        if cache is not None:
+            with tracer.stage("cache.get", text):
+                hit = cache.get(key)
+        if hit is not None:
+            results[index] = hit
+        else:
+            pending.append((index, key, _encode_stage(text, reversible, tracer)))
+
+    # Identity roundtrips and empty inputs are scored without the backend.
+    needs_embedding = [_needs_embedding(texts[index], stages[3], profile) for index, _, stages in pending]
+    embedded = [(texts[index], stages[2]) for (index, _, stages), needed in zip(pending, needs_embedding) if needed]
+    with tracer.stage("rdf.embedding", embedded):
+        infos = iter(embedding_similarities(embedded, backend=profile.embedding)) if embedded else iter(())
+    for (index, key, stages), needed in zip(pending, needs_embedding):
+        text = texts[index]
+        info = next(infos) if needed else None
+        result = _score_stage(text, *stages, semantic_info=info, profile=profile, instrument=tracer)
+        if cache is not None and _cacheable(result, backend):
+            with tracer.stage("cache.put"):
+                cache.put(key, result)
+        results[index] = result
+    for index, original in duplicates:
+        results[index] = results[original]
+    if tracer.attach:
+        report = tracer.report()
+        results = [{**result, "instrumentation": report} for result in results]  # type: ignore[dict-item]
+    return results  # type: ignore[return-value]
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="NTF Multimodal Pipeline")
     parser.add_argument("--input", help="Raw text input")
     parser.add_argument("--input-file", help="Path to text input file")
     parser.add_argument("--json", action="store_true", help="Print full JSON output")
+    parser.add_argument("--reversible", action="store_true", help="Encode text segments losslessly")
+    parser.add_argument(
+        "--profile",
+        choices=sorted(METRIC_PROFILES),
+        default=DEFAULT_PROFILE,
+        help="Metric profile: fast (SSR, plus RDF on identity roundtrips), standard (trigram similarity) or full",
+    )
+    parser.add_argument("--timings", action="store_true", help="Print per-stage wall/CPU time and bytes")
+    parser.add_argument("--timings-jsonl", help="Append per-stage samples to this JSONL file")
     args = parser.parse_args()
 
     if not args.input and not args.input_file:
@@ -463,15 +1534,25 @@ def main() -> None:
 
     text = Path(args.input_file).read_text(encoding="utf-8") if args.input_file else (args.input or "")
 
-    result = run_pipeline(text)
+    instrument = None
+    if args.timings or args.timings_jsonl:
+        sinks = [JsonlSink(args.timings_jsonl)] if args.timings_jsonl else []
+        instrument = Instrumentation(*sinks, attach=args.timings)
+    result = run_pipeline(text, reversible=args.reversible, profile=args.profile, instrument=instrument)
     if args.json:
         print(json.dumps(result, ensure_ascii=False, indent=2))
     else:
+        metrics = result["payload"]["metrics"]
         print(f"segments_detected: {result['segments_detected']}")
-        print(f"rdf: {result['payload']['metrics']['rdf']}")
-        print(f"scs: {result['payload']['metrics']['scs']}")
+        print(f"rdf: {metrics.get('rdf', 'skipped')}")
+        print(f"scs: {metrics.get('scs', 'skipped')}")
         print(f"ssr: {result['payload']['security']['ssr']}")
         print(f"risk_level: {result['payload']['security']['risk_level']}")
+        for sample in result.get("instrumentation", {}).get("stages", []):
+            print(
+                f"stage {sample['stage']}: wall_ms={sample['wall_ms']:.3f} cpu_ms={sample['cpu_ms']:.3f} "
+                f"bytes_in={sample['bytes_in']} bytes_out={sample['bytes_out']}"
+            )
 
 
 if __name__ == "__main__":
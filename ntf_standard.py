@@ -4,13 +4,36 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import math
+import os
 import re
+import sys
+import threading
+from array import array
 from collections import Counter, defaultdict
-from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import repeat
+from pathlib import Path
+from types import MappingProxyType
+from typing import TYPE_CHECKING, AbstractSet, Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
+from ntf_cache import ResultCache
+
+try:
+    import numpy as np  # optional: vectorized folding for large inputs
+except ImportError:  # pragma: no cover - depends on environment
+    np = None
+
+if TYPE_CHECKING:
+    from ntf_codebook import Codebook
+
+NTF_VERSION = "1.1"
+
+# Built-in vocabulary. The tables are compiled into the active
+# CompiledVocabulary at import; edits take effect on reload_vocabulary().
 NTF_VOCAB: List[str] = [
     "Flux",
     "Anchor",
@@ -65,6 +88,52 @@ KEYWORD_MAP: Dict[str, str] = {
     "context": "State",
 }
 
+# Multi-word entries, matched leftmost-longest on top of KEYWORD_MAP when
+# phrase matching is enabled. Keys are written as normalize_text would emit them.
+PHRASE_MAP: Dict[str, str] = {
+    "hand off": "Relay",
+    "hand over": "Relay",
+    "roll back": "Checkpoint",
+    "save point": "Checkpoint",
+    "state transition": "Flux",
+    "status update": "Pulse",
+    "heart beat": "Pulse",
+    "go live": "Deployment",
+    "roll out": "Deployment",
+    "ship it": "Deployment",
+    "speed up": "Overclock",
+    "sign off": "Consensus",
+    "sync up": "Resonance",
+    "look ahead": "Horizon",
+    "next steps": "Horizon",
+    "base line": "Anchor",
+    "ground truth": "Anchor",
+    "feedback loop": "Mirror",
+    "merge request": "Synthesis",
+    "pull together": "Weave",
+    "context window": "State",
+}
+
+_TOKEN_RE = re.compile(r"[a-zA-Z0-9']+")
+
+# Compact runs over at least this many tokens take the NumPy path when NumPy
+# is installed. Below it, array set-up costs more than the loop it replaces.
+NUMPY_MIN_TOKENS = 20_000
+# Output tokens of learned codebook entries look like "<#1f>" (see ntf_codebook).
+CODEBOOK_PREFIX = "<#"
+_TOKEN_TAIL_RE = re.compile(r"[a-zA-Z0-9']\Z")
+_TOKEN_LEAD_RE = re.compile(r"[a-zA-Z0-9']*")
+
+
+def _fingerprint(*parts: Any) -> str:
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def vocabulary_fingerprint() -> str:
+    """Short digest of the algorithm version and the active vocabulary, stable across processes."""
+    return _ACTIVE_VOCABULARY.fingerprint
+
 
 @dataclass
 class CompressionResult:
@@ -76,37 +145,174 @@ class CompressionResult:
     intfr: float
     used_vocab: List[str]
     clusters: Dict[str, List[str]]
+    patterns: Optional[Counter] = None
+    codebook_words: int = 0
+    inflected_words: int = 0
+    level: Optional[int] = field(default=None, compare=False)
+
+
+@dataclass(slots=True)
+class CompactResult:
+    """Count-based ``CompressionResult`` for callers that do not need raw cluster lists.
+
+    ``cluster_counts`` holds one occurrence count per concept, in first-seen
+    order like ``CompressionResult.clusters``. ``first_seen`` holds the token
+    offset where each vocabulary concept first appeared, or -1, in the order of
+    ``concepts``. Memory does not grow with the number of keyword occurrences.
+    """
+
+    original_words: int
+    compressed_tokens: int
+    coverage: float
+    ratio: float
+    diversity: float
+    intfr: float
+    used_vocab: List[str]
+    cluster_counts: Counter
+    first_seen: array
+    patterns: Optional[Counter] = None
+    codebook_words: int = 0
+    inflected_words: int = 0
+    level: Optional[int] = field(default=None, compare=False)
+    concepts: Tuple[str, ...] = field(default=(), repr=False, compare=False)
+
+    def first_offset(self, concept: str) -> int:
+        return self.first_seen[self.concepts.index(concept)] if concept in self.concepts else -1
 
 
 def normalize_text(text: str) -> List[str]:
-    return re.findall(r"[a-zA-Z0-9']+", text.lower())
+    return _TOKEN_RE.findall(text.lower())
+
+
+_ID_BITS = 32
+_ID_MASK = (1 << _ID_BITS) - 1
+_SKETCH_PRIME = (1 << 61) - 1
+
+
+class NGramDetector:
+    """Frequent n-gram detector over interned token IDs.
+
+    Every distinct token gets a 32-bit ID and the last ``max(sizes)`` IDs are
+    packed into one rolling integer key. The key is exact, so there are no
+    collisions. No n-gram string is built until ``patterns()`` reports the
+    survivors. Tokens can be fed in several batches, and windows span batches.
+
+    With ``sketch_width`` set, counts go into a count-min sketch of
+    ``sketch_depth`` rows instead. Only keys whose estimate reaches ``min_freq``
+    are tracked. Memory is then bounded by the sketch plus the frequent set,
+    but reported counts may over-count. They never under-count.
+    """
+
+    def __init__(
+        self,
+        min_freq: int = 3,
+        sizes: Tuple[int, ...] = (2, 3),
+        sketch_width: int = 0,
+        sketch_depth: int = 4,
+    ) -> None:
+        if not sizes or min(sizes) < 1:
+            raise ValueError("sizes must contain n-gram lengths >= 1")
+        self.min_freq = min_freq
+        self.sizes = tuple(sizes)
+        self._ids: Dict[str, int] = {}
+        self._words: List[str] = []
+        self._key = 0
+        self._seen = 0
+        self._masks = [(n, (1 << (_ID_BITS * n)) - 1) for n in self.sizes]
+        self._counts: Dict[int, Dict[int, int]] = {n: {} for n in self.sizes}
+        self._sketch_width = sketch_width
+        self._sketch: List[List[int]] = [[0] * sketch_width for _ in range(sketch_depth)] if sketch_width else []
+        self._sketch_salts = [
+            (0x9E3779B97F4A7C15 + 2 * row * 0x632BE59BD9B4E019, 0xBF58476D1CE4E5B9 * (row + 1))
+            for row in range(sketch_depth)
+        ]
+
+    def feed(self, tokens: Iterable[str]) -> "NGramDetector":
+        ids = self._ids
+        words = self._words
+        masks = self._masks
+        counts = self._counts
+        key = self._key
+        seen = self._seen
+        full_mask = (1 << (_ID_BITS * max(self.sizes))) - 1
+        sketched = bool(self._sketch_width)
+
+        for token in tokens:
+            tid = ids.get(token)
+            if tid is None:
+                tid = ids[token] = len(words)
+                words.append(token)
+            key = ((key << _ID_BITS) | tid) & full_mask
+            seen += 1
+            for n, mask in masks:
+                if seen < n:
+                    continue
+                gram = key & mask
+                if sketched:
+                    self._sketch_add(n, gram)
+                else:
+                    bucket = counts[n]
+                    bucket[gram] = bucket.get(gram, 0) + 1
+
+        self._key = key
+        self._seen = seen
+        return self
+
+    def end_document(self) -> "NGramDetector":
+        """Mark a document boundary: no later window spans it."""
+        self._key = 0
+        self._seen = 0
+        return self
+
+    def _sketch_add(self, n: int, gram: int) -> None:
+        width = self._sketch_width
+        estimate = None
+        # Salt with n so a 2-gram and a 3-gram never share a cell by construction.
+        salted = gram * 4 + n
+        for row, (mult, add) in zip(self._sketch, self._sketch_salts):
+            cell = ((salted * mult + add) % _SKETCH_PRIME) % width
+            row[cell] += 1
+            estimate = row[cell] if estimate is None else min(estimate, row[cell])
+        if estimate is not None and estimate >= self.min_freq:
+            self._counts[n][gram] = estimate
+
+    def _decode(self, n: int, gram: int) -> str:
+        words = self._words
+        return " ".join(words[(gram >> (_ID_BITS * (n - 1 - i))) & _ID_MASK] for i in range(n))
+
+    def patterns(self) -> Counter:
+        """N-grams seen at least ``min_freq`` times, shorter sizes first, in first-seen order."""
+        found: Counter = Counter()
+        for n in self.sizes:
+            for gram, count in self._counts[n].items():
+                if count >= self.min_freq:
+                    found[self._decode(n, gram)] = count
+        return found
 
 
 def detect_patterns(tokens: List[str], min_freq: int = 3) -> Counter:
-    counts: Counter = Counter()
-    for n in (2, 3):
-        for i in range(0, len(tokens) - n + 1):
-            counts[" ".join(tokens[i : i + n])] += 1
-    return Counter({k: v for k, v in counts.items() if v >= min_freq})
+    return NGramDetector(min_freq=min_freq).feed(tokens).patterns()
 
 
 def semantic_cluster(tokens: List[str]) -> Dict[str, List[str]]:
+    keyword_map = _ACTIVE_VOCABULARY._lookup
     clusters: Dict[str, List[str]] = defaultdict(list)
     for token in tokens:
-        mapped = KEYWORD_MAP.get(token)
+        mapped = keyword_map.get(token)
         if mapped:
             clusters[mapped].append(token)
     return dict(clusters)
 
 
 def compress_tokens(tokens: List[str]) -> Tuple[List[str], int, List[str]]:
+    keyword_map = _ACTIVE_VOCABULARY._lookup
     compressed: List[str] = []
     replaced = 0
     used_vocab = set()
     idx = 0
 
     while idx < len(tokens):
-        current = KEYWORD_MAP.get(tokens[idx])
+        current = keyword_map.get(tokens[idx])
         if not current:
             compressed.append(tokens[idx])
             idx += 1
@@ -114,7 +320,7 @@ def compress_tokens(tokens: List[str]) -> Tuple[List[str], int, List[str]]:
 
         run: List[str] = []
         while idx < len(tokens):
-            mapped = KEYWORD_MAP.get(tokens[idx])
+            mapped = keyword_map.get(tokens[idx])
             if not mapped:
                 break
             run.append(mapped)
@@ -136,35 +342,1294 @@ def compute_intfr(coverage: float, ratio: float, diversity: float) -> float:
     return round((coverage * ratio * diversity) * 10, 1)
 
 
-def run_ntf(text: str) -> CompressionResult:
-    tokens = normalize_text(text)
-    if not tokens:
-        return CompressionResult(0, 0, 0.0, 0.0, 0.0, 0.0, [], {})
+def _run_code(run_vocab: Iterable[str], run_len: int) -> str:
+    unique_run = sorted(run_vocab)
+    if run_len >= 2:
+        return "<NTF:" + "+".join(v[:3].upper() for v in unique_run[:4]) + ">"
+    return "<" + unique_run[0][:3].upper() + ">"
 
-    _patterns = detect_patterns(tokens)
-    clusters = semantic_cluster(tokens)
-    compressed, replaced, used_vocab = compress_tokens(tokens)
-
-    original_words = len(tokens)
-    compressed_tokens = len(compressed)
 
+def _score(
+    original_words: int,
+    compressed_tokens: int,
+    replaced: int,
+    used: int,
+    vocab_size: int,
+) -> Tuple[float, float, float, float]:
     coverage = replaced / original_words
     raw_ratio = original_words / compressed_tokens if compressed_tokens else 0.0
     ratio = min(raw_ratio / 10, 1.0)
-    diversity = len(used_vocab) / len(NTF_VOCAB)
+    diversity = used / vocab_size
+    return round(coverage, 2), round(ratio, 2), round(diversity, 2), compute_intfr(coverage, ratio, diversity)
+
 
+def _build_result(
+    original_words: int,
+    compressed_tokens: int,
+    replaced: int,
+    used_vocab: List[str],
+    clusters: Dict[str, List[str]],
+    vocab_size: int,
+) -> CompressionResult:
+    if not original_words:
+        return CompressionResult(0, 0, 0.0, 0.0, 0.0, 0.0, [], {})
+
+    coverage, ratio, diversity, intfr = _score(original_words, compressed_tokens, replaced, len(used_vocab), vocab_size)
     return CompressionResult(
         original_words=original_words,
         compressed_tokens=compressed_tokens,
-        coverage=round(coverage, 2),
-        ratio=round(ratio, 2),
-        diversity=round(diversity, 2),
-        intfr=compute_intfr(coverage, ratio, diversity),
+        coverage=coverage,
+        ratio=ratio,
+        diversity=diversity,
+        intfr=intfr,
         used_vocab=used_vocab,
         clusters=clusters,
     )
 
 
+def _build_compact_result(
+    original_words: int,
+    compressed_tokens: int,
+    replaced: int,
+    counts: Dict[str, int],
+    first_seen: Dict[str, int],
+    concepts: Tuple[str, ...],
+) -> CompactResult:
+    offsets = array("q", [first_seen.get(concept, -1) for concept in concepts])
+    if not original_words:
+        return CompactResult(0, 0, 0.0, 0.0, 0.0, 0.0, [], Counter(), offsets, concepts=concepts)
+
+    coverage, ratio, diversity, intfr = _score(original_words, compressed_tokens, replaced, len(counts), len(concepts))
+    return CompactResult(
+        original_words=original_words,
+        compressed_tokens=compressed_tokens,
+        coverage=coverage,
+        ratio=ratio,
+        diversity=diversity,
+        intfr=intfr,
+        used_vocab=sorted(counts),
+        cluster_counts=Counter(counts),
+        first_seen=offsets,
+        concepts=concepts,
+    )
+
+
+class _FoldState:
+    """Single-pass folding state: clustering, run folding and stats in one loop.
+
+    Tokens can be fed in several batches. An open keyword run stays open across
+    ``feed`` calls, so the result never depends on where the input was split.
+    In ``compact`` mode ``clusters`` maps each concept to a count instead of a
+    word list, and first-seen token offsets are tracked for ``CompactResult``.
+    The vocabulary is fixed for the life of the state; it defaults to the one
+    active when the state is created. ``codes``/``code_words`` count learned
+    codebook tokens and the words they stand for (phrase states only). With
+    ``inflections`` the keyword lookup also covers the vocabulary's inflection
+    table, and ``inflected`` counts the words matched only through it.
+    """
+
+    __slots__ = (
+        "filler",
+        "replaced",
+        "runs",
+        "codes",
+        "code_words",
+        "inflected",
+        "level",
+        "clusters",
+        "compact",
+        "first_seen",
+        "vocabulary",
+        "_keywords",
+        "_inflections",
+        "_run_len",
+        "_run_vocab",
+    )
+
+    def __init__(
+        self,
+        compact: bool = False,
+        vocabulary: Optional["CompiledVocabulary"] = None,
+        inflections: bool = False,
+    ) -> None:
+        self.filler = 0
+        self.replaced = 0
+        self.runs = 0
+        self.codes = 0
+        self.code_words = 0
+        self.inflected = 0
+        self.level: Optional[int] = None
+        self.clusters: Dict[str, Any] = {}
+        self.compact = compact
+        self.first_seen: Dict[str, int] = {}
+        self.vocabulary = vocabulary = vocabulary if vocabulary is not None else _ACTIVE_VOCABULARY
+        self._keywords = vocabulary._inflected_lookup if inflections else vocabulary._lookup
+        self._inflections = vocabulary.inflections if inflections else None
+        self._run_len = 0
+        self._run_vocab: set = set()
+
+    def feed(self, tokens: Iterable[str], emit: Optional[Callable[[str], None]] = None) -> None:
+        keyword_map = self._keywords
+        inflections = self._inflections
+        inflected = self.inflected
+        clusters = self.clusters
+        compact = self.compact
+        filler = self.filler
+        replaced = self.replaced
+        runs = self.runs
+        run_len = self._run_len
+        run_vocab = self._run_vocab
+
+        for token in tokens:
+            mapped = keyword_map.get(token)
+            if mapped is None:
+                if run_len:
+                    if emit is not None:
+                        emit(_run_code(run_vocab, run_len))
+                    replaced += run_len
+                    runs += 1
+                    run_len = 0
+                    run_vocab = set()
+                filler += 1
+                if emit is not None:
+                    emit(token)
+                continue
+
+            bucket = clusters.get(mapped)
+            if compact:
+                if bucket is None:
+                    clusters[mapped] = 1
+                    self.first_seen[mapped] = filler + replaced + run_len
+                else:
+                    clusters[mapped] = bucket + 1
+            elif bucket is None:
+                clusters[mapped] = [token]
+            else:
+                bucket.append(token)
+            if inflections is not None and token in inflections:
+                inflected += 1
+            run_len += 1
+            run_vocab.add(mapped)
+
+        self.inflected = inflected
+        self.filler = filler
+        self.replaced = replaced
+        self.runs = runs
+        self._run_len = run_len
+        self._run_vocab = run_vocab
+
+    def flush(self, emit: Optional[Callable[[str], None]] = None) -> None:
+        """Close a pending keyword run (end of input)."""
+        if not self._run_len:
+            return
+        if emit is not None:
+            emit(_run_code(self._run_vocab, self._run_len))
+        self.replaced += self._run_len
+        self.runs += 1
+        self._run_len = 0
+        self._run_vocab = set()
+
+    def result(self) -> Union[CompressionResult, CompactResult]:
+        """Statistics as if the input ended here; a pending run counts as closed."""
+        replaced = self.replaced + self._run_len
+        compressed_tokens = self.filler + self.runs + (1 if self._run_len else 0)
+        return self._build(self.filler + replaced, compressed_tokens, replaced)
+
+    def copy(self) -> "_FoldState":
+        """Independent copy; O(vocabulary) in compact mode, O(occurrences) otherwise."""
+        clone = object.__new__(type(self))
+        clone.filler = self.filler
+        clone.replaced = self.replaced
+        clone.runs = self.runs
+        clone.codes = self.codes
+        clone.code_words = self.code_words
+        clone.inflected = self.inflected
+        clone.level = self.level
+        clone.compact = self.compact
+        clone.clusters = dict(self.clusters) if self.compact else {k: list(v) for k, v in self.clusters.items()}
+        clone.first_seen = dict(self.first_seen)
+        clone.vocabulary = self.vocabulary
+        clone._keywords = self._keywords
+        clone._inflections = self._inflections
+        clone._run_len = self._run_len
+        clone._run_vocab = set(self._run_vocab)
+        return clone
+
+    def _build(self, original_words: int, compressed_tokens: int, replaced: int) -> Union[CompressionResult, CompactResult]:
+        concepts = self.vocabulary.concepts
+        original_words += self.code_words
+        compressed_tokens += self.codes
+        if self.compact:
+            result = _build_compact_result(original_words, compressed_tokens, replaced, self.clusters, self.first_seen, concepts)
+        else:
+            result = _build_result(original_words, compressed_tokens, replaced, sorted(self.clusters), self.clusters, len(concepts))
+        result.codebook_words = self.code_words
+        result.inflected_words = self.inflected
+        result.level = self.level
+        return result
+
+
+class _TrieNode:
+    __slots__ = ("value", "children")
+
+    def __init__(self) -> None:
+        self.value: Optional[str] = None
+        self.children: Dict[str, "_TrieNode"] = {}
+
+
+class KeywordAutomaton:
+    """Token-level trie compiled from the single-word and phrase keyword tables.
+
+    Edges are keyed by whole tokens. Python caches string hashes, so each edge
+    costs one dict probe, the same as a lookup by interned token ID. Matching is
+    leftmost-longest: from each position the trie is walked as far as the input
+    allows and the longest complete entry wins. The work per token is bounded
+    by ``max_len``, the longest phrase, however many entries the table holds.
+    """
+
+    __slots__ = ("_root", "max_len", "size", "_digest")
+
+    def __init__(self, keyword_map: Dict[str, str], phrase_map: Optional[Dict[str, str]] = None) -> None:
+        self._root = _TrieNode()
+        self.max_len = 1
+        self.size = 0
+        self._digest = hashlib.blake2b(NTF_VERSION.encode("utf-8"), digest_size=8)
+        for key, concept in keyword_map.items():
+            self.add(key, concept)
+        for key, concept in (phrase_map or {}).items():
+            self.add(key, concept)
+
+    def add(self, phrase: str, concept: str) -> None:
+        words = normalize_text(phrase)
+        if not words:
+            raise ValueError(f"empty keyword phrase: {phrase!r}")
+        node = self._root
+        for word in words:
+            child = node.children.get(word)
+            if child is None:
+                child = node.children[word] = _TrieNode()
+            node = child
+        if node.value is None:
+            self.size += 1
+        node.value = concept
+        self.max_len = max(self.max_len, len(words))
+        self._digest.update(f"{' '.join(words)}\x1f{concept}\x1e".encode("utf-8"))
+
+    @property
+    def fingerprint(self) -> str:
+        """Digest of every entry added so far, in insertion order."""
+        return self._digest.hexdigest()
+
+    def match(self, tokens: List[str], start: int) -> Tuple[int, Optional[str]]:
+        """Longest entry starting at ``start`` as ``(end, concept)``; ``(start, None)`` if none."""
+        node = self._root
+        best_end, best = start, None
+        idx = start
+        limit = len(tokens)
+        while idx < limit:
+            node = node.children.get(tokens[idx])
+            if node is None:
+                break
+            idx += 1
+            if node.value is not None:
+                best_end, best = idx, node.value
+        return best_end, best
+
+    def scan(self, tokens: List[str]) -> Iterator[Tuple[int, int, str]]:
+        """All leftmost-longest, non-overlapping matches as ``(start, end, concept)``."""
+        idx = 0
+        while idx < len(tokens):
+            end, concept = self.match(tokens, idx)
+            if concept is None:
+                idx += 1
+                continue
+            yield idx, end, concept
+            idx = end
+
+
+def compile_keyword_automaton(
+    keyword_map: Optional[Mapping[str, str]] = None,
+    phrase_map: Optional[Mapping[str, str]] = None,
+) -> KeywordAutomaton:
+    """Compile keyword and phrase tables (active vocabulary when omitted) into a trie."""
+    return KeywordAutomaton(
+        _ACTIVE_VOCABULARY.keyword_map if keyword_map is None else keyword_map,
+        _ACTIVE_VOCABULARY.phrase_map if phrase_map is None else phrase_map,
+    )
+
+
+_VOWELS = frozenset("aeiou")
+
+
+def light_stem(word: str) -> str:
+    """Strip one regular English inflection (-s, -es, -ies, -ed, -ing), undoubling a final consonant."""
+    for suffix, replacement in (("ies", "y"), ("ied", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            stem = word[: len(word) - len(suffix)] + replacement
+            if suffix == "s" and stem.endswith("s"):
+                return word
+            if suffix in ("ing", "ed") and len(stem) > 3 and stem[-1] == stem[-2] and stem[-1] not in _VOWELS and stem[-1] not in "lsz":
+                stem = stem[:-1]
+            return stem
+    return word
+
+
+# Inflection lists of the builtin vocabulary, and the defaults of vocabulary
+# files that leave them out. Keywords in INFLECTION_VERBS get -ed/-ing forms,
+# so nouns such as "deviation" never produce "deviationed". DOUBLING_VERBS
+# have more than one syllable and still double a final consonant
+# ("snapshotted"); one-syllable consonant-vowel-consonant verbs always do.
+# NON_INFLECTIONS have a meaning of their own ("futures" contracts) and are
+# never folded.
+INFLECTION_VERBS = frozenset(
+    """
+    accelerate agree align anchor baseline change checkpoint combine compress deploy drift fold
+    merge mirror overclock pulse reflect relay release snapshot state weave
+    """.split()
+)
+DOUBLING_VERBS = frozenset({"commit", "control", "snapshot", "submit", "transfer"})
+NON_INFLECTIONS = frozenset({"futures"})
+
+
+def _doubles_final_consonant(word: str, doubling: AbstractSet[str]) -> bool:
+    if word in doubling:
+        return True
+    vowel_groups = len(re.findall(r"[aeiou]+", word))
+    return vowel_groups == 1 and word[-1] not in _VOWELS | set("wxy") and word[-2] in _VOWELS and word[-3] not in _VOWELS
+
+
+def _inflected_forms(word: str, verb: bool = True, doubling: AbstractSet[str] = DOUBLING_VERBS) -> List[str]:
+    # The light stemmer run backwards: plural/third person, past and gerund.
+    if not word.isalpha() or len(word) < 3:
+        return []
+    consonant_y = word.endswith("y") and word[-2] not in _VOWELS
+    if word.endswith(("s", "x", "z", "ch", "sh")):
+        plural = word + "es"
+    else:
+        plural = word[:-1] + "ies" if consonant_y else word + "s"
+    if not verb:
+        return [plural]
+    if word.endswith("e"):
+        past = word + "d"
+        gerund = word + "ing" if word.endswith("ee") else word[:-1] + "ing"
+    elif _doubles_final_consonant(word, doubling):
+        past = word + word[-1] + "ed"
+        gerund = word + word[-1] + "ing"
+    else:
+        past = word[:-1] + "ied" if consonant_y else word + "ed"
+        gerund = word + "ing"
+    return [plural, past, gerund]
+
+
+def build_inflection_table(
+    keyword_map: Mapping[str, str],
+    verbs: AbstractSet[str] = INFLECTION_VERBS,
+    doubling: AbstractSet[str] = DOUBLING_VERBS,
+    exceptions: AbstractSet[str] = NON_INFLECTIONS,
+) -> Dict[str, str]:
+    """Inflected form -> keyword for every regular inflection of ``keyword_map``.
+
+    Every keyword gets its plural; only ``verbs`` also get past and gerund
+    forms, doubling the final consonant for ``doubling`` verbs. Forms are
+    generated from suffix rules and kept only when ``light_stem`` maps them
+    back to the keyword's own stem (ignoring a silent final "e"). Forms that
+    are keywords already, that are listed in ``exceptions``, or that would
+    map to two different concepts are left out.
+    """
+    table: Dict[str, str] = {}
+    ambiguous: set = set()
+    for word, concept in keyword_map.items():
+        stem = light_stem(word).rstrip("e")
+        for form in _inflected_forms(word, verb=word in verbs, doubling=doubling):
+            if form in keyword_map or form in exceptions or light_stem(form).rstrip("e") != stem:
+                continue
+            other = table.get(form)
+            if other is not None and keyword_map[other] != concept:
+                ambiguous.add(form)
+            table.setdefault(form, word)
+    for form in ambiguous:
+        del table[form]
+    return table
+
+
+@dataclass(frozen=True)
+class CompiledVocabulary:
+    """Immutable keyword tables, compiled once and shared by every fold.
+
+    ``keyword_map`` and ``phrase_map`` are read-only views. ``automaton`` is
+    the phrase trie used by ``phrases=True``. ``inflections`` maps inflected
+    forms ("deployed", "merging") to their keyword and is only consulted with
+    ``inflections=True``; ``verbs``, ``doubling_verbs`` and
+    ``non_inflections`` are the lists it was generated from. ``fingerprint``
+    digests the algorithm version and all tables, the inflection table
+    included, so cache entries and wire frames made
+    under one vocabulary are never served under another. Pickles by value,
+    which is how batch workers receive it.
+    """
+
+    name: str
+    concepts: Tuple[str, ...]
+    keyword_map: Mapping[str, str] = field(repr=False, compare=False)
+    phrase_map: Mapping[str, str] = field(repr=False, compare=False)
+    automaton: KeywordAutomaton = field(repr=False, compare=False)
+    fingerprint: str
+    _lookup: Dict[str, str] = field(repr=False, compare=False)
+    inflections: Mapping[str, str] = field(repr=False, compare=False)
+    inflected_automaton: KeywordAutomaton = field(repr=False, compare=False)
+    _inflected_lookup: Dict[str, str] = field(repr=False, compare=False)
+    _reversible_codes: Dict[str, str] = field(repr=False, compare=False)
+    _reversible_words: Dict[str, str] = field(repr=False, compare=False)
+    verbs: FrozenSet[str] = field(default=INFLECTION_VERBS, repr=False, compare=False)
+    doubling_verbs: FrozenSet[str] = field(default=DOUBLING_VERBS, repr=False, compare=False)
+    non_inflections: FrozenSet[str] = field(default=NON_INFLECTIONS, repr=False, compare=False)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return compile_vocabulary, (
+            self.concepts,
+            dict(self.keyword_map),
+            dict(self.phrase_map),
+            self.name,
+            self.verbs,
+            self.doubling_verbs,
+            self.non_inflections,
+        )
+
+
+def compile_vocabulary(
+    concepts: Sequence[str],
+    keyword_map: Mapping[str, str],
+    phrase_map: Optional[Mapping[str, str]] = None,
+    name: str = "custom",
+    verbs: Optional[Iterable[str]] = None,
+    doubling_verbs: Optional[Iterable[str]] = None,
+    non_inflections: Optional[Iterable[str]] = None,
+) -> CompiledVocabulary:
+    """Validate keyword tables and compile them into a ``CompiledVocabulary``.
+
+    Every keyword must be a single token as ``normalize_text`` emits it, and
+    every keyword or phrase must map to one of ``concepts``. Phrase keys are
+    normalized. ``verbs`` lists the keywords that get -ed/-ing inflections,
+    ``doubling_verbs`` and ``non_inflections`` refine them (see
+    ``build_inflection_table``); each defaults to the builtin list. Raises
+    ``ValueError`` on the first offending entry.
+    """
+    concepts = tuple(concepts)
+    if not concepts:
+        raise ValueError("vocabulary has no concepts")
+    if len(set(concepts)) != len(concepts):
+        raise ValueError("vocabulary concepts must be unique")
+    known = set(concepts)
+
+    lookup: Dict[str, str] = {}
+    for key, concept in keyword_map.items():
+        if normalize_text(key) != [key]:
+            raise ValueError(f"keyword {key!r} is not a single lowercase token; list it under phrases")
+        if concept not in known:
+            raise ValueError(f"keyword {key!r} maps to unknown concept {concept!r}")
+        lookup[key] = concept
+
+    phrases: Dict[str, str] = {}
+    for key, concept in (phrase_map or {}).items():
+        words = normalize_text(key)
+        if not words:
+            raise ValueError(f"empty keyword phrase: {key!r}")
+        if concept not in known:
+            raise ValueError(f"phrase {key!r} maps to unknown concept {concept!r}")
+        phrases[" ".join(words)] = concept
+
+    verb_set = INFLECTION_VERBS if verbs is None else frozenset(verbs)
+    if verbs is not None:
+        unknown = sorted(verb_set - set(lookup))
+        if unknown:
+            raise ValueError(f"verb {unknown[0]!r} is not a keyword")
+    doubling = DOUBLING_VERBS if doubling_verbs is None else frozenset(doubling_verbs)
+    exceptions = NON_INFLECTIONS if non_inflections is None else frozenset(non_inflections)
+
+    inflections = build_inflection_table(lookup, verb_set, doubling, exceptions)
+    inflected_lookup = {**{form: lookup[word] for form, word in inflections.items()}, **lookup}
+    return CompiledVocabulary(
+        name=name,
+        concepts=concepts,
+        keyword_map=MappingProxyType(lookup),
+        phrase_map=MappingProxyType(phrases),
+        automaton=KeywordAutomaton(lookup, phrases),
+        inflections=MappingProxyType(inflections),
+        inflected_automaton=KeywordAutomaton(inflected_lookup, phrases),
+        _inflected_lookup=inflected_lookup,
+        fingerprint=_fingerprint(NTF_VERSION, list(concepts), lookup, phrases, inflections),
+        _lookup=lookup,
+        verbs=verb_set,
+        doubling_verbs=doubling,
+        non_inflections=exceptions,
+        **_reversible_tables(lookup),
+    )
+
+
+_BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_REVERSIBLE_SIGIL = "~"
+_REVERSIBLE_RE = re.compile(r"~(~|[\^!]?[0-9A-Za-z]+)")
+
+
+def _reversible_tables(lookup: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+    # Keyword i is written as its base62 index, prefixed with "^" when the
+    # original was capitalized and "!" when it was all upper case.
+    codes: Dict[str, str] = {}
+    words: Dict[str, str] = {}
+    for index, word in enumerate(lookup):
+        digits = ""
+        while True:
+            index, rem = divmod(index, 62)
+            digits = _BASE62[rem] + digits
+            if not index:
+                break
+        for marker, form in (("", word), ("^", word[:1].upper() + word[1:]), ("!", word.upper())):
+            codes.setdefault(form, marker + digits)
+            words.setdefault(marker + digits, form)
+    return {"_reversible_codes": codes, "_reversible_words": words}
+
+
+def builtin_vocabulary() -> CompiledVocabulary:
+    """Compile the module tables ``NTF_VOCAB``, ``KEYWORD_MAP`` and ``PHRASE_MAP``."""
+    return compile_vocabulary(NTF_VOCAB, KEYWORD_MAP, PHRASE_MAP, name="builtin")
+
+
+def load_vocabulary(path: Union[str, Path]) -> CompiledVocabulary:
+    """Load and compile a JSON vocabulary file.
+
+    The file holds an object with ``vocab`` (list of concepts), ``keywords``
+    (word -> concept) and optionally ``phrases`` (phrase -> concept),
+    ``name`` (defaults to the file stem) and the inflection lists ``verbs``,
+    ``doubling_verbs`` and ``non_inflections`` (default to the builtin ones).
+    """
+    path = Path(path)
+    spec = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(spec, dict) or "vocab" not in spec or "keywords" not in spec:
+        raise ValueError(f"{path}: vocabulary needs 'vocab' and 'keywords' entries")
+    try:
+        return compile_vocabulary(
+            spec["vocab"],
+            spec["keywords"],
+            spec.get("phrases"),
+            name=spec.get("name", path.stem),
+            verbs=spec.get("verbs"),
+            doubling_verbs=spec.get("doubling_verbs"),
+            non_inflections=spec.get("non_inflections"),
+        )
+    except ValueError as exc:
+        raise ValueError(f"{path}: {exc}") from None
+
+
+_ACTIVE_VOCABULARY = builtin_vocabulary()
+_VOCABULARY_LOCK = threading.Lock()
+
+
+def active_vocabulary() -> CompiledVocabulary:
+    return _ACTIVE_VOCABULARY
+
+
+def use_vocabulary(vocabulary: CompiledVocabulary) -> CompiledVocabulary:
+    """Make ``vocabulary`` the active one and return the one it replaced.
+
+    The swap is a single reference assignment. Folds, streams and sessions
+    capture the active vocabulary when they start, so work in flight finishes
+    on the vocabulary it began with.
+    """
+    global _ACTIVE_VOCABULARY
+    with _VOCABULARY_LOCK:
+        previous = _ACTIVE_VOCABULARY
+        _ACTIVE_VOCABULARY = vocabulary
+    return previous
+
+
+def reload_vocabulary(path: Optional[Union[str, Path]] = None) -> CompiledVocabulary:
+    """Compile ``path`` (or the module tables when omitted) and activate it.
+
+    The new vocabulary is fully compiled before the swap; if loading fails the
+    active vocabulary is left untouched.
+    """
+    vocabulary = load_vocabulary(path) if path is not None else builtin_vocabulary()
+    use_vocabulary(vocabulary)
+    return vocabulary
+
+
+class VocabularyWatcher:
+    """Hot-reloads a vocabulary file whenever its size or mtime changes.
+
+    Long-lived workers call ``poll()`` between requests. Result caches keep
+    their entries across switches because keys carry the vocabulary
+    fingerprint, so switching back to a previous vocabulary hits warm entries.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._stamp: Optional[Tuple[int, int]] = None
+
+    def poll(self) -> bool:
+        """Reload if the file changed since the last successful load; True when it did."""
+        stat = self.path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return False
+        reload_vocabulary(self.path)
+        self._stamp = stamp
+        return True
+
+
+def encode_reversible(text: str, vocabulary: Optional[CompiledVocabulary] = None) -> str:
+    """Lossless NTF encoding: keywords become short codes, all other text is kept.
+
+    A keyword written in lower, capitalized or upper case becomes ``~``, an
+    optional case marker and its base62 keyword index (``~3``, ``~^3``,
+    ``~!3``). Other spellings stay literal, and a literal ``~`` is doubled.
+    Codes separated by a single space are written back to back.
+    ``decode_reversible`` under the same vocabulary restores ``text`` exactly.
+    """
+    vocabulary = vocabulary if vocabulary is not None else _ACTIVE_VOCABULARY
+    codes = vocabulary._reversible_codes
+    parts: List[str] = []
+    cursor = 0
+    last_code_end = -1
+
+    for match in _TOKEN_RE.finditer(text):
+        code = codes.get(match.group())
+        if code is None:
+            continue
+        start = match.start()
+        # Keyword tokens are maximal, so two codes are never adjacent in the
+        # source; back-to-back codes can stand for one space.
+        if not (cursor == last_code_end and start == cursor + 1 and text[cursor] == " "):
+            parts.append(text[cursor:start].replace(_REVERSIBLE_SIGIL, "~~"))
+        parts.append(_REVERSIBLE_SIGIL + code)
+        cursor = last_code_end = match.end()
+
+    parts.append(text[cursor:].replace(_REVERSIBLE_SIGIL, "~~"))
+    return "".join(parts)
+
+
+_BASE62_CHARS = frozenset(_BASE62)
+
+
+def decode_reversible(encoded: str, vocabulary: Optional[CompiledVocabulary] = None) -> str:
+    """Invert ``encode_reversible`` in one regex pass; ``ValueError`` on an unknown code."""
+    vocabulary = vocabulary if vocabulary is not None else _ACTIVE_VOCABULARY
+    words = vocabulary._reversible_words
+
+    def expand(match: "re.Match[str]") -> str:
+        code = match.group(1)
+        if code == _REVERSIBLE_SIGIL:
+            return code
+        word = words.get(code)
+        if word is None:
+            raise ValueError(f"unknown reversible NTF code ~{code}")
+        start = match.start()
+        return " " + word if start and encoded[start - 1] in _BASE62_CHARS else word
+
+    return _REVERSIBLE_RE.sub(expand, encoded)
+
+
+class _PhraseFoldState(_FoldState):
+    """``_FoldState`` that folds multi-word phrases through a ``KeywordAutomaton``.
+
+    Up to ``max_len - 1`` tokens are held back until enough lookahead has
+    arrived, so phrases may straddle ``feed`` calls. A phrase counts as one
+    unit of its keyword run. All of its words count as replaced. Entries whose
+    value starts with ``CODEBOOK_PREFIX`` are learned codebook codes: they are
+    emitted as one filler-like token and break keyword runs. Call ``flush()``
+    before ``result()``.
+    """
+
+    __slots__ = ("_automaton", "_pending")
+
+    def __init__(
+        self,
+        automaton: KeywordAutomaton,
+        compact: bool = False,
+        vocabulary: Optional[CompiledVocabulary] = None,
+        inflections: bool = False,
+    ) -> None:
+        super().__init__(compact, vocabulary, inflections)
+        self._automaton = automaton
+        self._pending: List[str] = []
+
+    def feed(self, tokens: Iterable[str], emit: Optional[Callable[[str], None]] = None) -> None:
+        self._pending.extend(tokens)
+        self._drain(final=False, emit=emit)
+
+    def _drain(self, final: bool, emit: Optional[Callable[[str], None]]) -> None:
+        pending = self._pending
+        automaton = self._automaton
+        clusters = self.clusters
+        lookahead = automaton.max_len
+        limit = len(pending) if final else len(pending) - lookahead + 1
+        idx = 0
+
+        while idx < limit:
+            end, mapped = automaton.match(pending, idx)
+            if mapped is None:
+                if self._run_len:
+                    self._close_run(emit)
+                self.filler += 1
+                if emit is not None:
+                    emit(pending[idx])
+                idx += 1
+                continue
+
+            if mapped.startswith(CODEBOOK_PREFIX):
+                if self._run_len:
+                    self._close_run(emit)
+                self.codes += 1
+                self.code_words += end - idx
+                if emit is not None:
+                    emit(mapped)
+                idx = end
+                continue
+
+            words = pending[idx:end]
+            if self._inflections is not None and end - idx == 1 and words[0] in self._inflections:
+                self.inflected += 1
+            if self.compact:
+                if mapped not in clusters:
+                    clusters[mapped] = 0
+                    self.first_seen[mapped] = self.filler + self.replaced + self.code_words
+                clusters[mapped] += 1
+            else:
+                clusters.setdefault(mapped, []).append(words[0] if len(words) == 1 else " ".join(words))
+            self.replaced += len(words)
+            self._run_len += 1
+            self._run_vocab.add(mapped)
+            idx = end
+
+        del pending[:idx]
+
+    def _close_run(self, emit: Optional[Callable[[str], None]]) -> None:
+        if emit is not None:
+            emit(_run_code(self._run_vocab, self._run_len))
+        self.runs += 1
+        self._run_len = 0
+        self._run_vocab = set()
+
+    def flush(self, emit: Optional[Callable[[str], None]] = None) -> None:
+        self._drain(final=True, emit=emit)
+        if self._run_len:
+            self._close_run(emit)
+
+    def copy(self) -> "_PhraseFoldState":
+        clone = super().copy()
+        clone._automaton = self._automaton
+        clone._pending = list(self._pending)
+        return clone
+
+    def result(self) -> Union[CompressionResult, CompactResult]:
+        if self._pending:
+            raise RuntimeError("flush() the phrase state before reading its result")
+        return self._build(
+            self.filler + self.replaced,
+            self.filler + self.runs + (1 if self._run_len else 0),
+            self.replaced,
+        )
+
+
+class _CountState(_FoldState):
+    """Level 0: tokens are counted and passed through, nothing is folded."""
+
+    __slots__ = ()
+
+    def feed(self, tokens: Iterable[str], emit: Optional[Callable[[str], None]] = None) -> None:
+        if emit is None:
+            self.filler += len(tokens) if isinstance(tokens, list) else sum(1 for _ in tokens)
+            return
+        for token in tokens:
+            self.filler += 1
+            emit(token)
+
+
+# Compression levels, cheapest first. Each level keeps everything below it.
+LEVELS: Dict[int, str] = {
+    0: "tokenize and count only",
+    1: "single-word keyword folding",
+    2: "level 1 plus phrases and inflections",
+    3: "level 2 plus codebook substitution",
+}
+
+
+def _level_options(level: int, phrases: bool, inflections: bool, folds: bool) -> Tuple[bool, bool]:
+    if level not in LEVELS:
+        raise ValueError(f"unknown compression level {level!r}; expected one of {sorted(LEVELS)}")
+    if level == 0 and (phrases or inflections or folds):
+        raise ValueError("level 0 does not fold; drop phrases, inflections, automaton and codebook")
+    return phrases or level >= 2, inflections or level >= 2
+
+
+def _new_fold_state(
+    phrases: bool,
+    automaton: Optional[KeywordAutomaton],
+    compact: bool = False,
+    vocabulary: Optional[CompiledVocabulary] = None,
+    codebook: Optional["Codebook"] = None,
+    inflections: bool = False,
+    level: Optional[int] = None,
+) -> _FoldState:
+    vocabulary = vocabulary if vocabulary is not None else _ACTIVE_VOCABULARY
+    if level is not None:
+        phrases, inflections = _level_options(level, phrases, inflections, automaton is not None or codebook is not None)
+        if level == 0:
+            state: _FoldState = _CountState(compact, vocabulary)
+            state.level = level
+            return state
+        state = _new_fold_state(phrases, automaton, compact, vocabulary, codebook, inflections)
+        state.level = level
+        return state
+    if codebook is not None:
+        if automaton is not None:
+            raise ValueError("pass either automaton or codebook, not both")
+        automaton = codebook.automaton(vocabulary, phrases, inflections)
+    if automaton is None and phrases:
+        automaton = vocabulary.inflected_automaton if inflections else vocabulary.automaton
+    if automaton is not None:
+        return _PhraseFoldState(automaton, compact, vocabulary, inflections)
+    return _FoldState(compact, vocabulary, inflections)
+
+
+def _fold_numpy(
+    tokens: List[str],
+    compact: bool = False,
+    vocabulary: Optional[CompiledVocabulary] = None,
+) -> Union[CompressionResult, CompactResult]:
+    """Vectorized equivalent of feeding ``tokens`` through a flushed ``_FoldState``.
+
+    Tokens become concept IDs (-1 for filler) in one ``map`` over a prebuilt
+    lookup. Runs are counted from the rising edges of the keyword mask, and
+    counts and first offsets come from bincount/unique.
+    """
+    vocabulary = vocabulary if vocabulary is not None else _ACTIVE_VOCABULARY
+    concepts = sorted(set(vocabulary.keyword_map.values()))
+    concept_index = {concept: idx for idx, concept in enumerate(concepts)}
+    lookup = {word: concept_index[mapped] for word, mapped in vocabulary.keyword_map.items()}
+    ids = np.fromiter(map(lookup.get, tokens, repeat(-1)), dtype=np.int32, count=len(tokens))
+
+    mask = ids >= 0
+    positions = np.flatnonzero(mask)
+    replaced = int(positions.size)
+    filler = len(tokens) - replaced
+    runs = int(np.count_nonzero(mask[1:] & ~mask[:-1])) + int(mask[:1].sum())
+
+    concept_ids = ids[positions]
+    present, first_idx = np.unique(concept_ids, return_index=True)
+    order = np.argsort(first_idx, kind="stable")
+    seen_order = [concepts[i] for i in present[order].tolist()]
+    first_offsets = positions[first_idx[order]].tolist()
+
+    if compact:
+        counts = np.bincount(concept_ids, minlength=len(concepts)).tolist()
+        return _build_compact_result(
+            len(tokens),
+            filler + runs,
+            replaced,
+            {concept: counts[concept_index[concept]] for concept in seen_order},
+            dict(zip(seen_order, first_offsets)),
+            vocabulary.concepts,
+        )
+
+    # A stable sort by concept groups each cluster's words in input order.
+    grouped = positions[np.argsort(concept_ids, kind="stable")].tolist()
+    bounds = np.cumsum(np.bincount(concept_ids, minlength=len(concepts))).tolist()
+    clusters = {}
+    for concept in seen_order:
+        idx = concept_index[concept]
+        start = bounds[idx - 1] if idx else 0
+        clusters[concept] = [tokens[i] for i in grouped[start : bounds[idx]]]
+    return _build_result(len(tokens), filler + runs, replaced, sorted(clusters), clusters, len(vocabulary.concepts))
+
+
+def run_ntf(
+    text: str,
+    patterns: bool = False,
+    min_freq: int = 3,
+    phrases: bool = False,
+    automaton: Optional[KeywordAutomaton] = None,
+    compact: bool = False,
+    cache: Optional[ResultCache] = None,
+    vocabulary: Optional[CompiledVocabulary] = None,
+    codebook: Optional["Codebook"] = None,
+    inflections: bool = False,
+    level: Optional[int] = None,
+) -> Union[CompressionResult, CompactResult]:
+    """Fold ``text`` in a single pass over its tokens.
+
+    Produces the same result as chaining ``normalize_text``, ``semantic_cluster``
+    and ``compress_tokens``, without materializing the intermediate lists.
+    Frequent n-grams are only collected into ``result.patterns`` when
+    ``patterns`` is set. ``phrases`` (or an explicit ``automaton``) also folds
+    multi-word phrase entries. ``vocabulary`` defaults to the active one
+    (see ``use_vocabulary``). A ``codebook`` (see ``ntf_codebook``) also
+    replaces learned filler phrases with one short code token each, in the
+    same pass; ``result.codebook_words`` counts the words they absorbed.
+    ``inflections`` also folds regular inflections of keywords ("deployed",
+    "merging") at the same O(1) lookup cost; ``result.inflected_words``
+    counts them, and they are included in ``coverage``. ``compact`` returns
+    a ``CompactResult`` with per-concept counts instead of word lists. Large
+    compact single-word runs use the NumPy engine when it is available.
+
+    ``level`` picks a point on the speed/ratio curve (see ``LEVELS``) and is
+    recorded in ``result.level``; explicit options add to what it enables.
+    Level 0 only counts tokens. Level 3 without a ``codebook`` mines one from
+    the document itself, and the entries it would have to ship are charged
+    to ``compressed_tokens``.
+
+    With a ``cache``, results are looked up by content hash plus the
+    vocabulary (or automaton) fingerprint and the call options.
+    """
+    vocabulary = vocabulary if vocabulary is not None else _ACTIVE_VOCABULARY
+    if cache is not None:
+        fingerprint = vocabulary.fingerprint
+        if automaton is not None:
+            fingerprint += "+" + automaton.fingerprint
+        if codebook is not None:
+            fingerprint += "+" + codebook.fingerprint
+        return cache.get_or_compute(
+            "ntf",
+            text,
+            lambda: run_ntf(
+                text,
+                patterns,
+                min_freq,
+                phrases,
+                automaton,
+                compact,
+                vocabulary=vocabulary,
+                codebook=codebook,
+                inflections=inflections,
+                level=level,
+            ),
+            fingerprint=(
+                f"{fingerprint}/p{int(patterns)}.{min_freq}/h{int(phrases)}/c{int(compact)}"
+                f"/i{int(inflections)}/l{'-' if level is None else level}"
+            ),
+        )
+
+    tokens = normalize_text(text)
+    emit: Optional[Callable[[str], None]] = None
+    used_codes: set = set()
+    if level == 3 and codebook is None:
+        from ntf_codebook import mine_codebook
+
+        codebook = mine_codebook([tokens], min_freq=min_freq, vocabulary=vocabulary, net_of_entries=True)
+
+        def emit(token: str) -> None:
+            if token.startswith(CODEBOOK_PREFIX):
+                used_codes.add(token)
+
+    if (
+        level is None
+        and compact
+        and np is not None
+        and not phrases
+        and automaton is None
+        and codebook is None
+        and not inflections
+        and len(tokens) >= NUMPY_MIN_TOKENS
+    ):
+        result = _fold_numpy(tokens, compact, vocabulary)
+    else:
+        state = _new_fold_state(phrases, automaton, compact, vocabulary, codebook, inflections, level)
+        state.feed(tokens, emit)
+        state.flush(emit)
+        # An in-document codebook travels with the output: each entry used
+        # costs its words plus its code.
+        state.codes += sum(len(codebook.expand([code])) + 1 for code in used_codes)
+        result = state.result()
+    if patterns:
+        result.patterns = detect_patterns(tokens, min_freq=min_freq)
+    return result
+
+
+class _ChunkTokenizer:
+    """Tokenizes a chunked character stream, holding back a word cut at a chunk edge.
+
+    The held-back word is kept as a list of pieces and only the new chunk is
+    scanned, so a long word arriving in small chunks costs linear time.
+    """
+
+    __slots__ = ("_carry",)
+
+    def __init__(self) -> None:
+        self._carry: List[str] = []
+
+    def feed(self, chunk: str) -> List[str]:
+        text = chunk.lower()
+        head: List[str] = []
+        if self._carry:
+            lead = _TOKEN_LEAD_RE.match(text).end()
+            if lead:
+                self._carry.append(text[:lead])
+            if lead == len(text):
+                return []
+            head = ["".join(self._carry)]
+            text = text[lead:]
+        tokens = _TOKEN_RE.findall(text)
+        if tokens and _TOKEN_TAIL_RE.search(text):
+            self._carry = [tokens.pop()]
+        else:
+            self._carry = []
+        return head + tokens if head else tokens
+
+    def pending(self) -> List[str]:
+        """The held-back word, as it would tokenize if the input ended now."""
+        return ["".join(self._carry)] if self._carry else []
+
+    def close(self) -> List[str]:
+        tokens = self.pending()
+        self._carry = []
+        return tokens
+
+
+class NTFStream:
+    """Compressed-token iterator over a chunked text source.
+
+    Iterating yields the same tokens ``compress_tokens`` would produce for the
+    concatenated input. Words and keyword runs may straddle chunk boundaries.
+    Only the current chunk, one partial word and the open run are held in
+    memory. Cluster word lists are the exception: they grow with every keyword
+    occurrence unless ``compact`` is set. ``result()`` returns the result once
+    the source is exhausted, draining any tokens not consumed yet.
+    """
+
+    def __init__(
+        self,
+        chunks: Iterable[str],
+        patterns: bool = False,
+        min_freq: int = 3,
+        phrases: bool = False,
+        automaton: Optional[KeywordAutomaton] = None,
+        compact: bool = False,
+        vocabulary: Optional[CompiledVocabulary] = None,
+        codebook: Optional["Codebook"] = None,
+        inflections: bool = False,
+        level: Optional[int] = None,
+    ) -> None:
+        if level == 3 and codebook is None:
+            raise ValueError("streaming level 3 needs a codebook")
+        self._chunks = chunks
+        self._state = _new_fold_state(phrases, automaton, compact, vocabulary, codebook, inflections, level)
+        self._detector = NGramDetector(min_freq=min_freq) if patterns else None
+        self._tokens: Optional[Iterator[str]] = None
+        self._done = False
+
+    def __iter__(self) -> Iterator[str]:
+        if self._tokens is None:
+            self._tokens = self._generate()
+        return self._tokens
+
+    def _generate(self) -> Iterator[str]:
+        tokenizer = _ChunkTokenizer()
+        state = self._state
+        detector = self._detector
+        out: List[str] = []
+        emit = out.append
+
+        for chunk in self._chunks:
+            tokens = tokenizer.feed(chunk)
+            state.feed(tokens, emit)
+            if detector is not None:
+                detector.feed(tokens)
+            if out:
+                yield from out
+                out.clear()
+
+        tokens = tokenizer.close()
+        state.feed(tokens, emit)
+        state.flush(emit)
+        if detector is not None:
+            detector.feed(tokens)
+        self._done = True
+        yield from out
+
+    def result(self) -> Union[CompressionResult, CompactResult]:
+        if not self._done:
+            for _ in self:
+                pass
+        result = self._state.result()
+        if self._detector is not None:
+            result.patterns = self._detector.patterns()
+        return result
+
+
+def run_ntf_stream(
+    chunks: Iterable[str],
+    patterns: bool = False,
+    min_freq: int = 3,
+    phrases: bool = False,
+    automaton: Optional[KeywordAutomaton] = None,
+    compact: bool = False,
+    vocabulary: Optional[CompiledVocabulary] = None,
+    codebook: Optional["Codebook"] = None,
+    inflections: bool = False,
+    level: Optional[int] = None,
+) -> NTFStream:
+    """Streaming ``run_ntf``: iterate for compressed tokens, then call ``result()``."""
+    return NTFStream(
+        chunks,
+        patterns=patterns,
+        min_freq=min_freq,
+        phrases=phrases,
+        automaton=automaton,
+        compact=compact,
+        vocabulary=vocabulary,
+        codebook=codebook,
+        inflections=inflections,
+        level=level,
+    )
+
+
+class NTFSession:
+    """Incremental NTF state for an append-only conversation.
+
+    ``append`` tokenizes and folds only the new text. Tokenizer carry, open
+    keyword run and phrase lookahead persist between calls, so a word or run
+    continuing across the append boundary folds exactly as in
+    ``run_ntf(full_history)``. ``append`` returns the compressed tokens that
+    became final. ``result()`` reports the history so far by folding the
+    small provisional tail on a copy of the state. That costs O(delta +
+    vocabulary) in the default compact mode. With ``compact=False`` the
+    cluster word lists are copied on every ``result()``.
+    """
+
+    def __init__(
+        self,
+        phrases: bool = False,
+        automaton: Optional[KeywordAutomaton] = None,
+        compact: bool = True,
+        vocabulary: Optional[CompiledVocabulary] = None,
+        codebook: Optional["Codebook"] = None,
+        inflections: bool = False,
+        level: Optional[int] = None,
+    ) -> None:
+        if level == 3 and codebook is None:
+            raise ValueError("session level 3 needs a codebook")
+        self._tokenizer = _ChunkTokenizer()
+        self._state = _new_fold_state(phrases, automaton, compact, vocabulary, codebook, inflections, level)
+        self.turns = 0
+
+    def append(self, text: str) -> List[str]:
+        out: List[str] = []
+        self._state.feed(self._tokenizer.feed(text), out.append)
+        self.turns += 1
+        return out
+
+    def _settled(self) -> Tuple[_FoldState, List[str]]:
+        tail: List[str] = []
+        state = self._state.copy()
+        state.feed(self._tokenizer.pending(), tail.append)
+        state.flush(tail.append)
+        return state, tail
+
+    def tail(self) -> List[str]:
+        """Provisional compressed tokens not yet returned by ``append``."""
+        return self._settled()[1]
+
+    def result(self) -> Union[CompressionResult, CompactResult]:
+        return self._settled()[0].result()
+
+
+def read_chunks(path: Union[str, Path], chunk_size: int = 1 << 16) -> Iterator[str]:
+    """Yield a UTF-8 text file in ``chunk_size`` character pieces."""
+    with open(path, encoding="utf-8") as handle:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _pack_result(result: Union[CompressionResult, CompactResult]) -> Union[tuple, CompactResult]:
+    if isinstance(result, CompactResult):
+        return result
+    # Interned cluster words are the same object each time, so pickle's memo
+    # ships every distinct word once per chunk instead of once per occurrence.
+    clusters = tuple((concept, tuple(map(sys.intern, words))) for concept, words in result.clusters.items())
+    patterns = tuple(result.patterns.items()) if result.patterns is not None else None
+    return (
+        result.original_words,
+        result.compressed_tokens,
+        result.coverage,
+        result.ratio,
+        result.diversity,
+        result.intfr,
+        tuple(result.used_vocab),
+        clusters,
+        patterns,
+        result.inflected_words,
+    )
+
+
+def _unpack_result(packed: Union[tuple, CompactResult]) -> Union[CompressionResult, CompactResult]:
+    if isinstance(packed, CompactResult):
+        return packed
+    words, compressed, coverage, ratio, diversity, intfr, used_vocab, clusters, patterns, inflected = packed
+    return CompressionResult(
+        original_words=words,
+        compressed_tokens=compressed,
+        coverage=coverage,
+        ratio=ratio,
+        diversity=diversity,
+        intfr=intfr,
+        used_vocab=list(used_vocab),
+        clusters={concept: list(tokens) for concept, tokens in clusters},
+        patterns=Counter(dict(patterns)) if patterns is not None else None,
+        inflected_words=inflected,
+    )
+
+
+def _batch_worker(
+    text: str,
+    patterns: bool = False,
+    phrases: bool = False,
+    compact: bool = False,
+    inflections: bool = False,
+) -> Union[tuple, CompactResult]:
+    return _pack_result(run_ntf(text, patterns=patterns, phrases=phrases, compact=compact, inflections=inflections))
+
+
+def run_ntf_batch(
+    texts: Iterable[str],
+    workers: Optional[int] = None,
+    chunksize: int = 64,
+    patterns: bool = False,
+    phrases: bool = False,
+    compact: bool = False,
+    vocabulary: Optional[CompiledVocabulary] = None,
+    inflections: bool = False,
+) -> List[Union[CompressionResult, CompactResult]]:
+    """Run ``run_ntf`` over many documents on a process pool, keeping input order.
+
+    Full results travel back as plain tuples; compact ones are small enough as is. Batches that fit in a single chunk, or
+    ``workers=1``, run in-process, where pool start-up would cost more than it saves.
+    Workers are started on ``vocabulary`` (default: the active one).
+    """
+    vocabulary = vocabulary if vocabulary is not None else _ACTIVE_VOCABULARY
+    items = list(texts)
+    if chunksize < 1:
+        raise ValueError("chunksize must be >= 1")
+    workers = min(workers or os.cpu_count() or 1, math.ceil(len(items) / chunksize))
+    if workers <= 1:
+        return [
+            run_ntf(text, patterns=patterns, phrases=phrases, compact=compact, vocabulary=vocabulary, inflections=inflections)
+            for text in items
+        ]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=use_vocabulary, initargs=(vocabulary,)) as pool:
+        packed = pool.map(
+            _batch_worker,
+            items,
+            [patterns] * len(items),
+            [phrases] * len(items),
+            [compact] * len(items),
+            [inflections] * len(items),
+            chunksize=chunksize,
+        )
+        return [_unpack_result(p) for p in packed]
+
+
 def build_benchmark_corpus(target_words: int = 4500) -> str:
     mapped_segment = "anchor drift pulse mirror relay consensus synthesis state "
     filler_segment = "agent packet channel timeline update signal route lattice module "
@@ -180,16 +1645,42 @@ def benchmark() -> CompressionResult:
 def main() -> None:
     parser = argparse.ArgumentParser(description="NTF Standard Algorithm v1.1")
     parser.add_argument("--text", type=str, help="Text input for compression")
+    parser.add_argument("--input-file", type=str, help="Stream a UTF-8 text file through NTF")
     parser.add_argument("--benchmark", action="store_true", help="Run 4,500-word benchmark")
     parser.add_argument("--json", action="store_true", help="Return JSON output")
+    parser.add_argument("--patterns", action="store_true", help="Also report frequent 2/3-grams")
+    parser.add_argument("--phrases", action="store_true", help="Also fold multi-word phrase entries")
+    parser.add_argument("--inflections", action="store_true", help="Also fold regular inflections of keywords")
+    parser.add_argument("--vocab", type=str, help="Load the vocabulary from a JSON file instead of the built-in one")
+    parser.add_argument("--level", type=int, choices=sorted(LEVELS), help="Compression level (0 fastest, 3 smallest)")
+    parser.add_argument("--codebook", type=str, help="Substitute entries of a codebook JSON file (see ntf_codebook)")
     args = parser.parse_args()
 
+    if args.vocab:
+        reload_vocabulary(args.vocab)
+    codebook = None
+    if args.codebook:
+        from ntf_codebook import load_codebook
+
+        codebook = load_codebook(args.codebook)
+    options = dict(
+        patterns=args.patterns,
+        phrases=args.phrases,
+        inflections=args.inflections,
+        codebook=codebook,
+        level=args.level,
+    )
+
     if args.benchmark:
         result = benchmark()
     elif args.text:
-        result = run_ntf(args.text)
+        result = run_ntf(args.text, **options)
+    elif args.input_file:
+        if args.level == 3 and codebook is None:
+            parser.error("--input-file with --level 3 needs --codebook")
+        result = run_ntf_stream(read_chunks(args.input_file), compact=True, **options).result()
     else:
-        parser.error("Provide --text or --benchmark")
+        parser.error("Provide --text, --input-file or --benchmark")
 
     payload = {
         "original_words": result.original_words,
@@ -203,6 +1694,17 @@ def main() -> None:
         "intfr": result.intfr,
         "used_vocab": result.used_vocab,
     }
+    if result.level is not None:
+        payload["level"] = result.level
+    if codebook is not None or result.level == 3:
+        payload["codebook_words"] = result.codebook_words
+    if args.inflections or (result.level or 0) >= 2:
+        payload["inflected_words"] = result.inflected_words
+        payload["inflected_coverage"] = (
+            round(result.inflected_words / result.original_words, 2) if result.original_words else 0.0
+        )
+    if result.patterns is not None:
+        payload["patterns"] = dict(result.patterns.most_common(20))
 
     if args.json:
         print(json.dumps(payload, indent=2))
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Binary wire format for compressed NTF token streams.
+
+A frame carries the tokens produced by ``compress_tokens``/``run_ntf_stream``:
+``<ABC>`` keyword codes, ``<NTF:ABC+DEF>`` run codes and raw filler words.
+Codebook codes (``<#1f>``) travel like filler words.
+
+Frame layout (all integers are unsigned LEB128 varints):
+
+    b"NW" | version (1 byte) | vocabulary fingerprint (8 bytes)
+    | dictionary size before this frame | item count | items...
+
+Each item is one varint whose low two bits select the kind:
+
+    0  new filler word: value = UTF-8 byte length, followed by the bytes.
+       The word is appended to the dictionary while it has room.
+    1  dictionary reference: value = index of a previously sent word
+    2  single keyword code: value = index into the vocabulary's concepts
+    3  keyword run: value = bitmask of concept indices in the run code
+
+The filler dictionary lives in a ``WireSession``, one per direction of a
+link, so repeated words cost one or two bytes across a whole conversation.
+Without a session the dictionary is scoped to a single frame. Frames are
+rejected when the fingerprint or the dictionary size does not match the
+decoder's, so a vocabulary mismatch or a lost frame fails loudly. Both ends
+use the vocabulary active when a frame is encoded or decoded.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ntf_standard import CODEBOOK_PREFIX, active_vocabulary, normalize_text, run_ntf_stream
+
+WIRE_MAGIC = b"NW"
+WIRE_VERSION = 1
+MAX_DICTIONARY = 1 << 16
+
+_NEW_WORD, _WORD_REF, _SINGLE, _RUN = range(4)
+
+
+@dataclass
+class WireSession:
+    """Filler dictionary shared by the frames of one link direction."""
+
+    words: Dict[str, int] = field(default_factory=dict)
+    table: List[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def _add(self, word: str) -> None:
+        if len(self.table) < MAX_DICTIONARY:
+            self.words[word] = len(self.table)
+            self.table.append(word)
+
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(frame: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(frame):
+            raise ValueError("truncated NTF wire frame")
+        byte = frame[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _abbreviations(concepts: Tuple[str, ...]) -> Dict[str, int]:
+    table: Dict[str, int] = {}
+    for idx, concept in enumerate(concepts):
+        abbr = concept[:3].upper()
+        if abbr in table:
+            raise ValueError(f"vocabulary abbreviation {abbr!r} is ambiguous on the wire")
+        table[abbr] = idx
+    return table
+
+
+def encode_frame(tokens: Iterable[str], session: Optional[WireSession] = None) -> bytes:
+    """Encode compressed NTF tokens into one binary frame."""
+    session = session if session is not None else WireSession()
+    vocabulary = active_vocabulary()
+    abbreviations = _abbreviations(vocabulary.concepts)
+    items = bytearray()
+    count = 0
+    dict_size = len(session)
+
+    for token in tokens:
+        count += 1
+        if token.startswith("<") and not token.startswith(CODEBOOK_PREFIX):
+            is_run = token.startswith("<NTF:")
+            body = token[5:-1] if is_run else token[1:-1]
+            mask = 0
+            for abbr in body.split("+"):
+                try:
+                    mask |= 1 << abbreviations[abbr]
+                except KeyError:
+                    raise ValueError(f"unknown keyword code {token!r}") from None
+            if is_run:
+                _put_varint(items, (mask << 2) | _RUN)
+            else:
+                _put_varint(items, ((mask.bit_length() - 1) << 2) | _SINGLE)
+            continue
+
+        ref = session.words.get(token)
+        if ref is not None:
+            _put_varint(items, (ref << 2) | _WORD_REF)
+            continue
+        raw = token.encode("utf-8")
+        _put_varint(items, (len(raw) << 2) | _NEW_WORD)
+        items += raw
+        session._add(token)
+
+    out = bytearray(WIRE_MAGIC)
+    out.append(WIRE_VERSION)
+    out += bytes.fromhex(vocabulary.fingerprint)
+    _put_varint(out, dict_size)
+    _put_varint(out, count)
+    out += items
+    return bytes(out)
+
+
+def decode_frame(frame: bytes, session: Optional[WireSession] = None) -> List[str]:
+    """Decode a frame from ``encode_frame`` back into compressed NTF tokens.
+
+    Raises ``ValueError`` on a malformed, truncated or foreign frame; the
+    session dictionary is then left as it was before the call.
+    """
+    session = session if session is not None else WireSession()
+    vocabulary = active_vocabulary()
+    concepts = vocabulary.concepts
+    if frame[:2] != WIRE_MAGIC:
+        raise ValueError("not an NTF wire frame")
+    if len(frame) < 3:
+        raise ValueError("truncated NTF wire frame header")
+    if frame[2] != WIRE_VERSION:
+        raise ValueError(f"unsupported NTF wire version {frame[2]}")
+    if len(frame) < 11:
+        raise ValueError("truncated NTF wire frame header")
+    if frame[3:11].hex() != vocabulary.fingerprint:
+        raise ValueError("NTF wire frame was encoded with a different vocabulary")
+
+    dict_size, pos = _get_varint(frame, 11)
+    if dict_size != len(session):
+        raise ValueError(f"wire session out of sync: frame expects {dict_size} words, have {len(session)}")
+    try:
+        return _decode_items(frame, pos, session, concepts)
+    except ValueError:
+        # Forget the words this frame added, so the session stays in sync.
+        added = session.table[dict_size:]
+        del session.table[dict_size:]
+        for word in added:
+            if session.words.get(word, -1) >= dict_size:
+                del session.words[word]
+                if word in session.table:
+                    session.words[word] = session.table.index(word)
+        raise
+
+
+def _decode_items(frame: bytes, pos: int, session: WireSession, concepts: Tuple[str, ...]) -> List[str]:
+    count, pos = _get_varint(frame, pos)
+    tokens: List[str] = []
+    for _ in range(count):
+        value, pos = _get_varint(frame, pos)
+        kind, value = value & 3, value >> 2
+        if kind == _NEW_WORD:
+            if pos + value > len(frame):
+                raise ValueError("truncated NTF wire frame")
+            word = frame[pos : pos + value].decode("utf-8")
+            pos += value
+            session._add(word)
+            tokens.append(word)
+        elif kind == _WORD_REF:
+            if value >= len(session.table):
+                raise ValueError(f"NTF wire frame references word {value} of a {len(session.table)}-word dictionary")
+            tokens.append(session.table[value])
+        elif kind == _SINGLE:
+            if value >= len(concepts):
+                raise ValueError(f"NTF wire frame references keyword {value} of a {len(concepts)}-concept vocabulary")
+            tokens.append("<" + concepts[value][:3].upper() + ">")
+        else:
+            if not value or value.bit_length() > len(concepts):
+                raise ValueError(f"NTF wire frame has an invalid keyword run mask {value:#x}")
+            run = sorted(concepts[idx] for idx in range(value.bit_length()) if value >> idx & 1)
+            tokens.append("<NTF:" + "+".join(c[:3].upper() for c in run) + ">")
+
+    if pos != len(frame):
+        raise ValueError("trailing bytes after NTF wire frame")
+    return tokens
+
+
+def encode_text(text: str, session: Optional[WireSession] = None, phrases: bool = False) -> bytes:
+    """Compress ``text`` with NTF and encode the token stream as one frame."""
+    return encode_frame(run_ntf_stream([text], phrases=phrases), session)
+
+
+def wire_savings(text: str) -> Dict[str, float]:
+    """Byte sizes of raw text, the textual NTF stream and its binary frame."""
+    tokens = list(run_ntf_stream([text]))
+    textual = len(" ".join(tokens).encode("utf-8"))
+    binary = len(encode_frame(tokens))
+    return {
+        "raw_bytes": len(text.encode("utf-8")),
+        "words": len(normalize_text(text)),
+        "ntf_text_bytes": textual,
+        "ntf_wire_bytes": binary,
+        "wire_vs_ntf_text": round(textual / binary, 2) if binary else 0.0,
+    }
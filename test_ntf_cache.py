@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import ntf_standard
+from ntf_cache import ResultCache, content_key
+from ntf_multimodal_pipeline import run_pipeline
+from ntf_standard import compile_keyword_automaton, run_ntf
+
+
+def test_lru_eviction_and_counters():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.snapshot() == {
+        "hits": 1,
+        "misses": 1,
+        "evictions": 1,
+        "disk_hits": 0,
+        "disk_writes": 0,
+        "hit_rate": 0.5,
+        "entries": 2,
+    }
+
+
+def test_run_ntf_cache_hits_and_option_keys():
+    cache = ResultCache()
+    text = "heartbeat pulse agent status ok"
+    first = run_ntf(text, cache=cache)
+    assert run_ntf(text, cache=cache) is first
+    assert first == run_ntf(text)
+
+    compact = run_ntf(text, compact=True, cache=cache)
+    assert compact == run_ntf(text, compact=True)
+    phrases = run_ntf(text, automaton=compile_keyword_automaton(), cache=cache)
+    assert phrases is not first
+    assert (cache.stats.hits, cache.stats.misses) == (1, 3)
+
+
+def test_keyword_map_change_invalidates(monkeypatch):
+    cache = ResultCache()
+    text = "agent status ok"
+    before = run_ntf(text, cache=cache)
+    monkeypatch.setattr(ntf_standard, "_ACTIVE_VOCABULARY", ntf_standard.active_vocabulary())
+    monkeypatch.setitem(ntf_standard.KEYWORD_MAP, "status", "Pulse")
+    ntf_standard.reload_vocabulary()
+    after = run_ntf(text, cache=cache)
+    assert before.used_vocab == [] and after.used_vocab == ["Pulse"]
+    assert cache.stats.misses == 2
+
+
+def test_disk_tier_survives_new_cache(tmp_path):
+    text = "Flux anchor.\n\n```python\nprint('x')\n```"
+    warm = ResultCache(disk_dir=tmp_path)
+    expected = run_pipeline(text, cache=warm)
+    assert warm.stats.disk_writes == 1
+
+    cold = ResultCache(disk_dir=tmp_path)
+    assert run_pipeline(text, cache=cold) == expected
+    assert cold.stats.disk_hits == 1
+    assert content_key("pipeline", text) != content_key("pipeline", text + " ")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import json
+import random
+
+import pytest
+
+from ntf_cache import ResultCache
+from ntf_codebook import Codebook, codebook_report, load_codebook, mine_codebook, read_jsonl_texts
+from ntf_standard import NTFSession, run_ntf, run_ntf_stream
+
+CORPUS = [
+    "please find the attached report for the weekly review, state drift is low",
+    "please find the attached report for the weekly review and anchor the baseline",
+    "as discussed in the weekly review please find the attached report",
+    "relay handoff done, as discussed in the weekly review",
+]
+
+
+def test_mined_entries_skip_keywords_and_rank_by_savings():
+    book = mine_codebook(CORPUS, min_freq=3)
+    assert book.entries[0] == "please find the attached"
+    assert "weekly review" in book.entries
+    assert not any("state" in entry.split() for entry in book.entries)
+    assert book.code(0) == "<#0>" and book.code(36) == "<#10>"
+
+
+def test_codebook_substitution_expands_back_to_plain_stream():
+    book = mine_codebook(CORPUS, min_freq=2)
+    rng = random.Random(29)
+    for text in CORPUS + [" ".join(rng.choice(CORPUS) for _ in range(20))]:
+        plain = list(run_ntf_stream([text]))
+        coded = list(run_ntf_stream([text], codebook=book))
+        assert book.expand(coded) == plain
+        assert len(coded) < len(plain)
+
+        result = run_ntf(text, compact=True, codebook=book)
+        base = run_ntf(text, compact=True)
+        assert result.original_words == base.original_words
+        assert result.compressed_tokens == len(coded)
+        assert result.codebook_words > 0 and result.coverage == base.coverage
+
+
+def test_codebook_streams_and_sessions_match_single_shot():
+    book = mine_codebook(CORPUS, min_freq=2)
+    text = " ".join(CORPUS * 3)
+    expected = run_ntf(text, codebook=book, phrases=True)
+    pieces = [text[i : i + 7] for i in range(0, len(text), 7)]
+    assert run_ntf_stream(pieces, codebook=book, phrases=True).result() == expected
+
+    session = NTFSession(codebook=book, compact=False, phrases=True)
+    for piece in pieces:
+        session.append(piece)
+    assert session.result() == expected
+
+
+def test_codebook_file_roundtrip_and_cache_key(tmp_path):
+    book = mine_codebook(CORPUS, min_freq=2, name="office")
+    path = tmp_path / "office.json"
+    book.save(path)
+    loaded = load_codebook(path)
+    assert loaded == book and loaded.fingerprint == book.fingerprint
+
+    cache = ResultCache()
+    run_ntf(CORPUS[0], cache=cache)
+    run_ntf(CORPUS[0], cache=cache, codebook=loaded)
+    assert cache.stats.misses == 2
+
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    payload["entries"].reverse()
+    path.write_text(json.dumps(payload), encoding="utf-8")
+    with pytest.raises(ValueError, match="fingerprint"):
+        load_codebook(path)
+    with pytest.raises(ValueError, match="two tokens"):
+        Codebook(("single",))
+
+
+def test_report_on_eval_datasets():
+    texts = list(read_jsonl_texts(["eval/datasets/multimodal_expanded_120.jsonl"]))
+    report = codebook_report(texts, mine_codebook(texts, min_freq=2))
+    assert report["codebook_tokens"] < report["compressed_tokens"]
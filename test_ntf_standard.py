@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+
+import json
+import pickle
+import random
+from collections import Counter
+
+import pytest
+
+import ntf_standard
+
+from ntf_standard import (
+    KEYWORD_MAP,
+    NTF_VOCAB,
+    CompactResult,
+    CompressionResult,
+    NGramDetector,
+    NTFSession,
+    VocabularyWatcher,
+    active_vocabulary,
+    build_benchmark_corpus,
+    builtin_vocabulary,
+    build_inflection_table,
+    compile_keyword_automaton,
+    compile_vocabulary,
+    compress_tokens,
+    compute_intfr,
+    decode_reversible,
+    detect_patterns,
+    encode_reversible,
+    light_stem,
+    load_vocabulary,
+    normalize_text,
+    read_chunks,
+    run_ntf,
+    run_ntf_batch,
+    run_ntf_stream,
+    semantic_cluster,
+    use_vocabulary,
+    vocabulary_fingerprint,
+)
+from ntf_standard import _FoldState, _fold_numpy
+
+
+def _reference_run_ntf(text: str) -> CompressionResult:
+    """The original multi-pass composition, kept as the equivalence oracle."""
+    tokens = normalize_text(text)
+    if not tokens:
+        return CompressionResult(0, 0, 0.0, 0.0, 0.0, 0.0, [], {})
+
+    clusters = semantic_cluster(tokens)
+    compressed, replaced, used_vocab = compress_tokens(tokens)
+    coverage = replaced / len(tokens)
+    ratio = min((len(tokens) / len(compressed)) / 10, 1.0)
+    diversity = len(used_vocab) / len(NTF_VOCAB)
+    return CompressionResult(
+        original_words=len(tokens),
+        compressed_tokens=len(compressed),
+        coverage=round(coverage, 2),
+        ratio=round(ratio, 2),
+        diversity=round(diversity, 2),
+        intfr=compute_intfr(coverage, ratio, diversity),
+        used_vocab=used_vocab,
+        clusters=clusters,
+    )
+
+
+def _random_text(rng: random.Random, length: int, density: float) -> str:
+    keywords = list(KEYWORD_MAP.keys())
+    filler = ["the", "Agent", "packet", "isn't", "42", "route,", "State-", "DRIFT"]
+    words = [rng.choice(keywords) if rng.random() < density else rng.choice(filler) for _ in range(length)]
+    return " ".join(words)
+
+
+def test_fused_engine_matches_reference_on_random_corpora():
+    rng = random.Random(7)
+    for length in (0, 1, 2, 17, 250, 5000):
+        for density in (0.0, 0.1, 0.5, 0.9, 1.0):
+            text = _random_text(rng, length, density)
+            assert run_ntf(text) == _reference_run_ntf(text)
+
+
+def test_fused_engine_matches_reference_on_edge_cases():
+    cases = [
+        "",
+        "   ...  ",
+        "flux",
+        "flux flux flux",
+        "the the the",
+        "anchor drift pulse mirror relay consensus synthesis state agent",
+        build_benchmark_corpus(4500),
+    ]
+    for text in cases:
+        assert run_ntf(text) == _reference_run_ntf(text)
+
+
+def _reference_detect_patterns(tokens, min_freq=3):
+    counts = Counter()
+    for n in (2, 3):
+        for i in range(0, len(tokens) - n + 1):
+            counts[" ".join(tokens[i : i + n])] += 1
+    return Counter({k: v for k, v in counts.items() if v >= min_freq})
+
+
+def test_detect_patterns_matches_string_join_reference():
+    rng = random.Random(11)
+    for length in (0, 1, 2, 3, 40, 3000):
+        tokens = normalize_text(_random_text(rng, length, 0.4))
+        for min_freq in (1, 3, 10):
+            expected = _reference_detect_patterns(tokens, min_freq)
+            found = detect_patterns(tokens, min_freq)
+            assert found == expected
+            assert list(found) == list(expected)
+
+
+def test_ngram_detector_streams_across_batches_and_sketch_never_undercounts():
+    tokens = normalize_text(build_benchmark_corpus(2000))
+    exact = detect_patterns(tokens)
+
+    batched = NGramDetector()
+    for start in range(0, len(tokens), 37):
+        batched.feed(tokens[start : start + 37])
+    assert batched.patterns() == exact
+
+    sketched = NGramDetector(sketch_width=512).feed(tokens).patterns()
+    assert set(exact) <= set(sketched)
+    assert all(sketched[gram] >= count for gram, count in exact.items())
+
+
+def test_run_ntf_patterns_are_opt_in():
+    text = build_benchmark_corpus(600)
+    assert run_ntf(text).patterns is None
+    assert run_ntf(text, patterns=True).patterns == detect_patterns(normalize_text(text))
+
+
+def _split(text, rng):
+    chunks, start = [], 0
+    while start < len(text):
+        end = start + rng.randint(1, 9)
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+def test_stream_matches_run_ntf_for_arbitrary_chunking():
+    rng = random.Random(3)
+    for length in (0, 1, 60, 800):
+        text = _random_text(rng, length, 0.6)
+        stream = run_ntf_stream(_split(text, rng), patterns=True)
+        assert list(stream) == compress_tokens(normalize_text(text))[0]
+        assert stream.result() == run_ntf(text, patterns=True)
+
+
+def test_stream_keeps_keyword_run_and_word_across_boundary(tmp_path):
+    stream = run_ntf_stream(["agent anch", "or dri", "ft pulse ro", "ute"])
+    assert list(stream) == ["agent", "<NTF:ANC+DRI+PUL>", "route"]
+
+    path = tmp_path / "export.txt"
+    path.write_text("relay handoff\nstate context " * 500, encoding="utf-8")
+    result = run_ntf_stream(read_chunks(path, chunk_size=7)).result()
+    assert result == run_ntf(path.read_text(encoding="utf-8"))
+
+
+def test_long_word_streamed_in_small_chunks_is_scanned_once(monkeypatch):
+    scanned = [0]
+    token_re = ntf_standard._TOKEN_RE
+
+    class Counting:
+        def findall(self, text):
+            scanned[0] += len(text)
+            return token_re.findall(text)
+
+    monkeypatch.setattr(ntf_standard, "_TOKEN_RE", Counting())
+    text = "relay " + "x" * 40_000 + " anchor drift"
+    pieces = [text[i : i + 4] for i in range(0, len(text), 4)]
+    result = run_ntf_stream(pieces).result()
+    assert scanned[0] <= 2 * len(text)
+
+    session = NTFSession()
+    for piece in pieces:
+        session.append(piece)
+    monkeypatch.undo()
+    assert result == run_ntf(text)
+    assert session.result() == run_ntf(text, compact=True)
+
+
+def test_batch_preserves_order_in_process_and_on_pool():
+    rng = random.Random(5)
+    texts = [_random_text(rng, rng.randint(0, 300), rng.random()) for _ in range(40)]
+    expected = [run_ntf(text) for text in texts]
+
+    assert run_ntf_batch(texts, workers=1) == expected
+    assert run_ntf_batch(texts, workers=2, chunksize=8) == expected
+    assert run_ntf_batch(texts[:3], workers=2, chunksize=2, patterns=True) == [
+        run_ntf(text, patterns=True) for text in texts[:3]
+    ]
+
+
+def test_automaton_without_phrases_matches_keyword_lookup():
+    rng = random.Random(13)
+    single_words = compile_keyword_automaton(phrase_map={})
+    for length in (0, 5, 700):
+        text = _random_text(rng, length, 0.5)
+        assert run_ntf(text, automaton=single_words) == run_ntf(text)
+
+
+def test_phrases_fold_leftmost_longest():
+    stream = run_ntf_stream(["agents hand o", "ff the state tran", "sition, then roll back state"], phrases=True)
+    assert list(stream) == ["agents", "<REL>", "the", "<FLU>", "then", "<NTF:CHE+STA>"]
+
+    result = stream.result()
+    assert result.clusters == {"Relay": ["hand off"], "Flux": ["state transition"], "Checkpoint": ["roll back"], "State": ["state"]}
+    assert result.original_words == 10
+    assert result.coverage == 0.7
+    assert result == run_ntf("agents hand off the state transition, then roll back state", phrases=True)
+
+
+def test_automaton_scales_to_large_phrase_tables():
+    phrase_map = {f"term{i} part{i % 7} tail{i % 3}": NTF_VOCAB[i % len(NTF_VOCAB)] for i in range(5000)}
+    phrase_map["term1 part1"] = "Pulse"
+    automaton = compile_keyword_automaton(phrase_map=phrase_map)
+    assert automaton.size == len(KEYWORD_MAP) + len(phrase_map)
+
+    tokens = normalize_text("term1 part1 tail1 term1 part1 flux term42 part0 tail0 term9 part2")
+    assert list(automaton.scan(tokens)) == [(0, 3, NTF_VOCAB[1]), (3, 5, "Pulse"), (5, 6, "Flux"), (6, 9, NTF_VOCAB[42 % 16])]
+
+
+def test_compact_result_keeps_counts_and_first_offsets():
+    rng = random.Random(17)
+    for length in (0, 9, 900):
+        text = _random_text(rng, length, 0.5)
+        full = run_ntf(text)
+        compact = run_ntf(text, compact=True)
+        assert isinstance(compact, CompactResult)
+        assert compact.cluster_counts == Counter({k: len(v) for k, v in full.clusters.items()})
+        assert list(compact.cluster_counts) == list(full.clusters)
+        for field in ("original_words", "compressed_tokens", "coverage", "ratio", "diversity", "intfr", "used_vocab"):
+            assert getattr(compact, field) == getattr(full, field)
+
+    result = run_ntf("agent relay handoff state anchor", compact=True)
+    assert result.first_offset("Relay") == 1
+    assert result.first_offset("Anchor") == 4
+    assert result.first_offset("Flux") == -1
+    assert not hasattr(result, "__dict__")
+
+
+def test_compact_mode_for_phrases_stream_and_batch():
+    text = "agents hand off the state transition then roll back state " * 20
+    expected = run_ntf(text, phrases=True, compact=True)
+    assert expected.cluster_counts["Relay"] == 20
+    assert expected.first_offset("Flux") == 4
+    assert run_ntf_stream(_split(text, random.Random(1)), phrases=True, compact=True).result() == expected
+    assert run_ntf_batch([text] * 4, workers=2, chunksize=1, phrases=True, compact=True) == [expected] * 4
+
+
+def test_numpy_engine_matches_python_loop(monkeypatch):
+    np = pytest.importorskip("numpy")
+    assert np is ntf_standard.np
+    rng = random.Random(19)
+    for length in (0, 1, 2, 50, 3000):
+        for density in (0.0, 0.3, 1.0):
+            tokens = normalize_text(_random_text(rng, length, density))
+            for compact in (False, True):
+                state = _FoldState(compact)
+                state.feed(tokens)
+                assert _fold_numpy(tokens, compact) == state.result()
+
+    text = build_benchmark_corpus(900)
+    expected = run_ntf(text, compact=True)
+    monkeypatch.setattr(ntf_standard, "NUMPY_MIN_TOKENS", 10)
+    monkeypatch.setattr(ntf_standard, "_FoldState", None)
+    assert run_ntf(text, compact=True) == expected
+
+
+def test_session_matches_full_recompute_after_every_append():
+    rng = random.Random(23)
+    for phrases in (False, True):
+        for compact in (True, False):
+            session = NTFSession(phrases=phrases, compact=compact)
+            history = ""
+            emitted = []
+            for piece in ["agents hand", " off the ", "state tran", "sition anch", "or", " drift", ". roll back"]:
+                emitted += session.append(piece)
+                history += piece
+                assert session.result() == run_ntf(history, phrases=phrases, compact=compact)
+                assert emitted + session.tail() == list(run_ntf_stream([history], phrases=phrases))
+            for _ in range(20):
+                piece = _random_text(rng, rng.randint(0, 12), 0.6) + rng.choice(["", " ", "\n"])
+                session.append(piece)
+                history += piece
+                assert session.result() == run_ntf(history, phrases=phrases, compact=compact)
+
+
+def test_vocabulary_file_loads_and_hot_reloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(ntf_standard, "_ACTIVE_VOCABULARY", active_vocabulary())
+    finance = load_vocabulary("vocab/finance.json")
+    assert finance.name == "finance" and finance.fingerprint != vocabulary_fingerprint()
+    with pytest.raises(TypeError):
+        finance.keyword_map["hedge"] = "Flux"
+
+    text = "desk hedge roll and net exposure at end of day"
+    builtin = run_ntf(text, phrases=True, compact=True)
+    session = NTFSession()
+    previous = use_vocabulary(finance)
+    assert run_ntf(text, phrases=True, compact=True).cluster_counts == Counter({"Relay": 1, "State": 1, "Checkpoint": 1})
+    assert run_ntf_batch([text] * 3, workers=2, chunksize=1, phrases=True) == [run_ntf(text, phrases=True)] * 3
+    assert session.append("hedge exposure ") == ["hedge", "exposure"]
+    use_vocabulary(previous)
+    assert run_ntf(text, phrases=True, compact=True) == builtin
+
+    path = tmp_path / "ops.json"
+    path.write_text('{"vocab": ["Pulse"], "keywords": {"ping": "Pulse"}}', encoding="utf-8")
+    watcher = VocabularyWatcher(path)
+    assert watcher.poll() and not watcher.poll()
+    assert active_vocabulary().name == "ops"
+    assert run_ntf("ping ping flux", compact=True).first_offset("Pulse") == 0
+
+    path.write_text('{"vocab": ["Pulse"], "keywords": {"ping": "Flux"}}', encoding="utf-8")
+    with pytest.raises(ValueError, match="unknown concept 'Flux'"):
+        watcher.poll()
+    assert active_vocabulary().name == "ops"
+
+
+def test_compile_vocabulary_rejects_bad_tables():
+    with pytest.raises(ValueError, match="single lowercase token"):
+        compile_vocabulary(["Relay"], {"hand off": "Relay"})
+    with pytest.raises(ValueError, match="unique"):
+        compile_vocabulary(["Relay", "Relay"], {})
+    vocabulary = compile_vocabulary(["Relay"], {"relay": "Relay"}, {"Hand  Off": "Relay"})
+    assert dict(vocabulary.phrase_map) == {"hand off": "Relay"}
+
+
+def test_reversible_encoding_roundtrips_exactly():
+    rng = random.Random(31)
+    alphabet = ["anchor", "Drift", "PULSE", "ReLaY", "state's", "~", "~~", " ", "  ", "\n", ",", "é", "x", "42", "Context"]
+    for _ in range(300):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert decode_reversible(encode_reversible(text)) == text
+
+    text = "Anchor drift pulse, RELAY handoff ~ state"
+    encoded = encode_reversible(text)
+    assert encoded == "~^2~4~6, ~!C~D ~~ ~U"
+    assert decode_reversible(encoded) == text
+    with pytest.raises(ValueError, match="unknown reversible"):
+        decode_reversible("~zz")
+
+
+def test_inflection_table_covers_regular_forms():
+    table = build_inflection_table(KEYWORD_MAP)
+    for form, word in [("deployed", "deploy"), ("releases", "release"), ("merging", "merge"), ("snapshots", "snapshot"), ("aligned", "align"), ("agreeing", "agree")]:
+        assert table[form] == word
+        assert light_stem(form).rstrip("e") == light_stem(word).rstrip("e")
+    assert not set(table) & set(KEYWORD_MAP)
+    assert table["snapshotted"] == table["snapshotting"] == "snapshot"
+    assert "snapshoted" not in table and "snapshoting" not in table
+    # Nouns only get plurals.
+    assert table["deviations"] == "deviation"
+    for form in ("deviationed", "resonanced", "futured", "contexted"):
+        assert form not in table
+
+    pins = build_inflection_table({"pin": "A", "pine": "B"}, verbs={"pin", "pine"})
+    assert pins["pinned"] == pins["pinning"] == "pin" and pins["pined"] == pins["pining"] == "pine"
+    ambiguous = build_inflection_table({"box": "A", "boxe": "B"})
+    assert "boxes" not in ambiguous
+
+    finance = load_vocabulary("vocab/finance.json")
+    assert "futures" not in finance.inflections
+    assert run_ntf("futures desk", inflections=True, vocabulary=finance).coverage == 0.0
+    assert run_ntf("snapshotted state", inflections=True).coverage == 1.0
+
+
+def test_vocabulary_files_choose_their_inflection_verbs(tmp_path):
+    finance = load_vocabulary("vocab/finance.json")
+    assert finance.inflections["hedged"] == "hedge" and "hedged" not in builtin_vocabulary().inflections
+
+    spec = {"vocab": ["Relay"], "keywords": {"ship": "Relay", "cargo": "Relay"}}
+    path = tmp_path / "ops.json"
+    path.write_text(json.dumps(spec), encoding="utf-8")
+    nouns = load_vocabulary(path)
+    assert dict(nouns.inflections) == {"ships": "ship", "cargos": "cargo"}
+
+    path.write_text(json.dumps({**spec, "verbs": ["ship"], "non_inflections": ["ships"]}), encoding="utf-8")
+    verbs = load_vocabulary(path)
+    assert verbs.inflections["shipped"] == verbs.inflections["shipping"] == "ship" and "ships" not in verbs.inflections
+    # The table is part of the fingerprint, so cached results never cross it.
+    assert verbs.fingerprint != nouns.fingerprint
+    assert pickle.loads(pickle.dumps(verbs)).inflections == verbs.inflections
+
+    path.write_text(json.dumps({**spec, "verbs": ["sail"]}), encoding="utf-8")
+    with pytest.raises(ValueError, match="verb 'sail' is not a keyword"):
+        load_vocabulary(path)
+
+
+def test_inflections_fold_like_their_keywords_and_are_counted():
+    table = build_inflection_table(KEYWORD_MAP)
+    rng = random.Random(37)
+    forms = list(table)
+    for length in (0, 1, 40, 900):
+        words = [rng.choice(forms) if rng.random() < 0.3 else w for w in _random_text(rng, length, 0.3).split()]
+        text = " ".join(words)
+        canonical = " ".join(table.get(w, w) for w in words)
+        for phrases in (False, True):
+            result = run_ntf(text, compact=True, phrases=phrases, inflections=True)
+            expected = run_ntf(canonical, compact=True, phrases=phrases)
+            assert result.inflected_words == sum(w in table for w in words)
+            expected.inflected_words = result.inflected_words
+            assert result == expected
+            assert run_ntf_stream(_split(text, rng), compact=True, phrases=phrases, inflections=True).result() == result
+
+    text = "we deployed releases while merging"
+    assert run_ntf(text).coverage == 0.0
+    full = run_ntf(text, inflections=True)
+    assert full.clusters == {"Deployment": ["deployed", "releases"], "Synthesis": ["merging"]}
+    assert run_ntf_batch([text] * 2, workers=2, chunksize=1, inflections=True) == [full] * 2
+
+
+def test_levels_trade_cpu_for_ratio():
+    text = "please find the attached report: we deployed releases, hand off to the state owner. " * 6
+    results = [run_ntf(text, level=level, compact=True) for level in range(4)]
+    assert [r.level for r in results] == [0, 1, 2, 3]
+    assert len({r.original_words for r in results}) == 1
+    assert results[0].compressed_tokens == results[0].original_words and results[0].coverage == 0.0
+    assert [r.compressed_tokens for r in results] == sorted((r.compressed_tokens for r in results), reverse=True)
+    assert results[3].compressed_tokens < results[2].compressed_tokens
+
+    assert run_ntf(text, level=2) == run_ntf(text, phrases=True, inflections=True)
+    assert run_ntf(text, level=1) == run_ntf(text) and run_ntf(text).level is None
+    assert run_ntf_stream(_split(text, random.Random(2)), level=0).result() == run_ntf(text, level=0)
+    assert list(run_ntf_stream([text], level=0)) == normalize_text(text)
+
+    with pytest.raises(ValueError, match="level 0 does not fold"):
+        run_ntf(text, level=0, phrases=True)
+    with pytest.raises(ValueError, match="unknown compression level"):
+        run_ntf(text, level=4)
+    with pytest.raises(ValueError, match="needs a codebook"):
+        NTFSession(level=3)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import pytest
+
+import ntf_standard
+from ntf_standard import build_benchmark_corpus, compress_tokens, normalize_text, run_ntf_stream
+from ntf_wire import WireSession, decode_frame, encode_frame, encode_text, wire_savings
+
+
+def test_frame_roundtrip_restores_token_stream():
+    text = build_benchmark_corpus(2000) + " route relay handoff state isn't 42 agent flux"
+    tokens = compress_tokens(normalize_text(text))[0]
+    frame = encode_frame(tokens)
+    assert decode_frame(frame) == tokens
+    assert len(frame) < len(" ".join(tokens).encode("utf-8")) / 2
+
+    phrase_tokens = list(run_ntf_stream(["hand off the roll back state"], phrases=True))
+    assert decode_frame(encode_text("hand off the roll back state", phrases=True)) == phrase_tokens
+
+
+def test_session_dictionary_spans_frames():
+    sender, receiver = WireSession(), WireSession()
+    messages = ["agent packet flux anchor route", "agent packet drift route", "packet agent route pulse"]
+    frames = [encode_text(m, sender) for m in messages]
+    assert len(frames[2]) < len(encode_text(messages[2]))
+    for message, frame in zip(messages, frames):
+        assert decode_frame(frame, receiver) == list(run_ntf_stream([message]))
+
+    with pytest.raises(ValueError, match="out of sync"):
+        decode_frame(frames[1], WireSession())
+
+
+def test_frame_rejects_other_vocabulary(monkeypatch):
+    frame = encode_text("flux anchor agent")
+    monkeypatch.setattr(ntf_standard, "_ACTIVE_VOCABULARY", ntf_standard.active_vocabulary())
+    monkeypatch.setitem(ntf_standard.KEYWORD_MAP, "agent", "State")
+    ntf_standard.reload_vocabulary()
+    with pytest.raises(ValueError, match="different vocabulary"):
+        decode_frame(frame)
+
+
+def test_malformed_and_truncated_frames_raise_value_error():
+    frame = encode_text("agent packet flux anchor route drift")
+    for cut in range(len(frame)):
+        with pytest.raises(ValueError):
+            decode_frame(frame[:cut])
+    with pytest.raises(ValueError, match="not an NTF wire frame"):
+        decode_frame(b"N")
+    with pytest.raises(ValueError, match="truncated NTF wire frame header"):
+        decode_frame(frame[:2])
+    with pytest.raises(ValueError, match="truncated NTF wire frame header"):
+        decode_frame(frame[:10])
+    with pytest.raises(ValueError, match="unsupported NTF wire version 9"):
+        decode_frame(frame[:2] + bytes([9]) + frame[3:])
+
+    header = frame[:11]
+    for item, message in [
+        (bytes([(5 << 2) | 1]), "references word 5"),
+        (bytes([(20 << 2) | 2]), "references keyword 20"),
+        (bytes([3]), "invalid keyword run mask"),
+    ]:
+        with pytest.raises(ValueError, match=message):
+            decode_frame(header + bytes([0, 1]) + item)
+
+    # A frame that fails midway leaves the session as it was.
+    session = WireSession()
+    bad = header + bytes([0, 2, (3 << 2) | 0]) + b"abc" + bytes([(9 << 2) | 1])
+    with pytest.raises(ValueError, match="references word 9"):
+        decode_frame(bad, session)
+    assert len(session) == 0 and session.words == {}
+    assert decode_frame(frame, session) == list(run_ntf_stream(["agent packet flux anchor route drift"]))
+
+
+def test_wire_savings_report():
+    report = wire_savings(build_benchmark_corpus(1000))
+    assert report["ntf_wire_bytes"] < report["ntf_text_bytes"] < report["raw_bytes"]